@@ -0,0 +1,130 @@
+"""Shared pieces of the benchmarks: platforms, a stub hass and message streams.
+
+Not a benchmark itself; imported by the bench_* modules.
+"""
+
+import json
+import random
+import time
+
+from homeassistant.core_config import DATA_CUSTOMIZE
+
+from custom_components.aqara_bridge.core.aiot_mapping import AIOT_DEVICE_MAPPING
+
+PLATFORMS = (
+    "air_quality",
+    "binary_sensor",
+    "climate",
+    "cover",
+    "event",
+    "light",
+    "remote",
+    "sensor",
+    "switch",
+)
+
+EVENT_TYPES = (
+    "gateway_online",
+    "gateway_offline",
+    "subdevice_online",
+    "subdevice_offline",
+)
+
+
+class BenchBus:
+    def fire(self, *args, **kwargs):
+        pass
+
+
+class BenchCustomize:
+    def get(self, entity_id):
+        return {}
+
+
+class BenchHass:
+    """实体和_msg_callback用到的Home Assistant接口，不做任何实际操作"""
+
+    class config:
+        time_zone = "UTC"
+
+    def __init__(self):
+        self.data = {DATA_CUSTOMIZE: BenchCustomize()}
+        self.bus = BenchBus()
+
+    def add_job(self, *args):
+        pass
+
+    def async_create_task(self, coro, *args, **kwargs):
+        coro.close()
+
+
+def mapping_models() -> list:
+    """映射表中的所有型号，保持映射表中的顺序"""
+    return [k for x in AIOT_DEVICE_MAPPING for k in x if k != "params"]
+
+
+def gen_messages(manager, count: int, seed: int = 0, event_ratio: float = 0) -> list:
+    """生成消息流：resource_report每条1-3个资源，约5%未知设备，event_ratio为事件消息比例"""
+    rnd = random.Random(seed)
+    keys = list(manager._resource_dispatch)
+    dids = list(manager._devices_entities)
+    now = int(time.time() * 1000)
+    messages = []
+    for i in range(count):
+        ts = str(now + i)
+        if rnd.random() < event_ratio:
+            messages.append(
+                {
+                    "eventType": rnd.choice(EVENT_TYPES),
+                    "time": ts,
+                    "data": [{"subjectId": rnd.choice(dids), "time": ts}],
+                }
+            )
+            continue
+        data = []
+        for _ in range(rnd.randint(1, 3)):
+            subject_id, resource_id = rnd.choice(keys)
+            if rnd.random() < 0.05:
+                subject_id = "lumi.unknown"
+            data.append(
+                {
+                    "subjectId": subject_id,
+                    "resourceId": resource_id,
+                    "value": str(rnd.randint(1, 2)),
+                    "time": ts,
+                }
+            )
+        messages.append({"msgType": "resource_report", "time": ts, "data": data})
+    return messages
+
+
+def load_capture(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_capture(path: str, messages: list):
+    with open(path, "w", encoding="utf-8") as f:
+        for msg in messages:
+            f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+
+
+def add_message_args(parser):
+    """设备数量、消息数量和抓包回放/录制的命令行参数"""
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--capture", help="JSONL file, one MQ message per line")
+    parser.add_argument("--record", help="write the replayed messages as JSONL")
+    parser.add_argument("--repeat", type=int, default=3)
+
+
+def load_messages(args, manager, event_ratio: float = 0) -> list:
+    """按命令行参数读取抓包或生成消息流，指定--record时保存"""
+    if args.capture:
+        messages = load_capture(args.capture)
+    else:
+        messages = gen_messages(manager, args.messages, args.seed, event_ratio)
+    if args.record:
+        save_capture(args.record, messages)
+    return messages
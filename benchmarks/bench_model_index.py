@@ -0,0 +1,104 @@
+"""Micro-benchmark: model lookups during entity setup.
+
+Compares the old linear scans over AIOT_DEVICE_MAPPING with the precomputed
+model index, for a synthetic account of supported devices. Also compares
+loading the index by executing aiot_mapping.py with loading the prebuilt
+aiot_model_index.pickle and decoding the models of an account of --models
+distinct models (time and memory retained by the index).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_model_index --devices 300 --models 20
+"""
+
+import argparse
+import importlib.util
+import itertools
+import timeit
+import tracemalloc
+
+from benchmarks._harness import PLATFORMS, mapping_models
+from custom_components.aqara_bridge.core.aiot_mapping import (
+    AIOT_DEVICE_MAPPING,
+    get_model_spec,
+)
+from custom_components.aqara_bridge.core.aiot_model_index import load_artifact
+
+
+def legacy_setup(models):
+    """AiotDevice.__init__ + async_add_entities lookups before the index."""
+    for model in models:
+        for device in AIOT_DEVICE_MAPPING:
+            if model in device:
+                break
+        for platform in PLATFORMS:
+            for device in AIOT_DEVICE_MAPPING:
+                if model in device:
+                    [p[platform] for p in device["params"] if platform in p]
+                    break
+
+
+def indexed_setup(models):
+    for model in models:
+        spec = get_model_spec(model)
+        for platform in PLATFORMS:
+            spec.platform_params.get(platform, ())
+
+
+def load_literal(models):
+    """重新执行aiot_mapping.py，HA组件已导入，只计算映射表本身"""
+    spec = importlib.util.find_spec("custom_components.aqara_bridge.core.aiot_mapping")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    index = module.AIOT_MODEL_INDEX
+    for model in models:
+        index.get(model)
+    return index
+
+
+def load_prebuilt(models):
+    index = load_artifact()
+    for model in models:
+        index.get(model)
+    return index
+
+
+def measure_load(func, models, repeat):
+    best = min(timeit.repeat(lambda: func(models), number=1, repeat=repeat))
+    tracemalloc.start()
+    index = func(models)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+    return best, retained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=300)
+    parser.add_argument("--models", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if load_artifact() is None:
+        parser.error("aiot_model_index.pickle is stale, rebuild it first")
+    all_models = mapping_models()
+    step = max(1, len(all_models) // args.models)
+    account = all_models[::step][: args.models]
+    for name, func in (("literal", load_literal), ("artifact", load_prebuilt)):
+        best, retained = measure_load(func, account, args.repeat)
+        print(
+            f"{name:>12}: {best * 1000:8.3f} ms, {retained / 1024:8.1f} KiB "
+            f"to load {len(account)} models"
+        )
+
+    models = list(itertools.islice(itertools.cycle(mapping_models()), args.devices))
+    for name, func in (("linear scan", legacy_setup), ("model index", indexed_setup)):
+        best = min(
+            timeit.repeat(lambda: func(models), number=1, repeat=args.repeat)
+        )
+        print(f"{name:>12}: {best * 1000:8.3f} ms for {len(models)} devices")
+
+
+if __name__ == "__main__":
+    main()
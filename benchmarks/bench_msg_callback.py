@@ -0,0 +1,131 @@
+"""Micro-benchmark: MQ message handling in AiotManager._msg_callback.
+
+Replays a message stream through the message callback as it was before
+(INFO messages formatted eagerly, message time converted for every message)
+and through the current one, with logging at the Home Assistant default level.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_msg_callback --messages 20000
+    python -m benchmarks.bench_msg_callback --capture messages.jsonl
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks._harness import (
+    PLATFORMS,
+    BenchHass,
+    add_message_args,
+    load_messages,
+    mapping_models,
+)
+from custom_components.aqara_bridge.core.aiot_manager import (
+    AiotDevice,
+    AiotEntityBase,
+    AiotManager,
+)
+from custom_components.aqara_bridge.core.const import (
+    DOMAIN,
+    HASS_DATA_AIOT_MANAGER,
+    MK_INIT_PARAMS,
+    MK_RESOURCES,
+)
+from custom_components.aqara_bridge.core.utils import ts_format_str_ms
+
+_LOGGER = logging.getLogger("custom_components.aqara_bridge.core.aiot_manager")
+
+
+class BenchEntity(AiotEntityBase):
+    def convert_res_to_attr(self, res_name, res_value):
+        return res_value
+
+
+def build_manager(devices: int):
+    """每个支持的型号创建设备，直到达到设备数量，并为每个平台创建实体"""
+    hass = BenchHass()
+    manager = AiotManager(hass, None)
+    manager.set_coalesce_window(0)
+    hass.data[DOMAIN] = {HASS_DATA_AIOT_MANAGER: manager}
+    models = mapping_models()
+    for i in range(devices):
+        device = AiotDevice(
+            did=f"lumi.{i:012x}", model=models[i % len(models)], deviceName=str(i)
+        )
+        for platform in PLATFORMS:
+            for params in device.get_platform_params(platform):
+                entity = BenchEntity(
+                    hass,
+                    device,
+                    params[MK_RESOURCES],
+                    platform,
+                    1,
+                    **params[MK_INIT_PARAMS],
+                )
+                manager._add_device_entity(device.did, entity)
+    return manager
+
+
+async def legacy_msg_callback(self, msg):
+    """_msg_callback中属性消息的处理，修改前的写法"""
+    msg_time = ts_format_str_ms(msg.get("time"), self._hass)
+    for x in msg["data"]:
+        targets = self._resource_dispatch.get((x["subjectId"], x["resourceId"]))
+        if targets:
+            _LOGGER.info(
+                "[msg_callback, {}]msg_time:{}, msg_data:{}".format(
+                    "async_set_attr", msg_time, msg["data"]
+                )
+            )
+            for entity, _ in targets:
+                await entity.async_set_attr(x["resourceId"], x["value"], x["time"])
+        elif x["subjectId"] in self._devices_entities:
+            _LOGGER.info(
+                "[msg_callback, unsupport_resources]{}, {}, {}:{}".format(
+                    ts_format_str_ms(x["time"], self._hass),
+                    x["subjectId"],
+                    x["resourceId"],
+                    x["value"],
+                )
+            )
+        else:
+            _LOGGER.info(
+                "[msg_callback, not_in_devices_entities]{}, {}".format(
+                    ts_format_str_ms(x["time"], self._hass), x
+                )
+            )
+
+
+async def replay(callback, messages) -> float:
+    start = time.perf_counter()
+    for msg in messages:
+        await callback(msg)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_message_args(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    manager = build_manager(args.devices)
+    messages = load_messages(args, manager)
+
+    for name, callback in (
+        ("before", lambda msg: legacy_msg_callback(manager, msg)),
+        ("current", manager._msg_callback),
+    ):
+        best = min(
+            asyncio.run(replay(callback, messages)) for _ in range(args.repeat)
+        )
+        print(
+            f"{name:>8}: {best * 1000:8.1f} ms for {len(messages)} messages, "
+            f"{len(messages) / best:10.0f} msg/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
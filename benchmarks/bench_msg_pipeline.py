@@ -0,0 +1,220 @@
+"""Offline replay benchmark for the MQ message pipeline.
+
+Builds an AiotManager with synthetic devices for every model in
+AIOT_DEVICE_MAPPING, creates the real entities of every platform through the
+platforms' async_setup_entry (detached from Home Assistant, so state writes are
+only counted), and replays a stream of resource_report and event messages
+through AiotManager._msg_callback. No RocketMQ consumer or network is used.
+
+Reports throughput, per-message latency, state writes, errors and memory
+allocated while replaying. --min-throughput and --max-p99 make it exit
+non-zero, so it can guard the hot path in CI.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_msg_pipeline --messages 20000
+    python -m benchmarks.bench_msg_pipeline --record messages.jsonl
+    python -m benchmarks.bench_msg_pipeline --capture messages.jsonl --max-p99 0.5
+"""
+
+import argparse
+import asyncio
+import gc
+import importlib
+import logging
+import sys
+import time
+import tracemalloc
+
+from benchmarks._harness import (
+    PLATFORMS,
+    BenchHass,
+    add_message_args,
+    load_messages,
+    mapping_models,
+)
+from custom_components.aqara_bridge.core.aiot_cloud import AiotCloud
+from custom_components.aqara_bridge.core.aiot_manager import (
+    CHANNEL_PROBED_MODELS,
+    AiotDevice,
+    AiotEntityBase,
+    AiotManager,
+)
+from custom_components.aqara_bridge.core.const import (
+    DOMAIN,
+    HASS_DATA_AIOTCLOUD,
+    HASS_DATA_AIOT_MANAGER,
+)
+
+# 多通道设备在基准测试中的通道数量
+BENCH_CHANNEL_COUNT = 4
+# 事件消息的比例
+BENCH_EVENT_RATIO = 0.02
+
+
+class BenchEntry:
+    entry_id = "bench"
+    options = {}
+    data = {}
+
+
+class StateWriteCounter:
+    """替换实体的schedule_update_ha_state，只计数"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+async def async_build_manager(devices: int, coalesce_window: float = 0):
+    """创建管理器和设备，并通过各平台的async_setup_entry创建实体"""
+    hass = BenchHass()
+    manager = AiotManager(hass, None)
+    manager.set_coalesce_window(coalesce_window)
+    hass.data[DOMAIN] = {
+        HASS_DATA_AIOT_MANAGER: manager,
+        HASS_DATA_AIOTCLOUD: AiotCloud(),
+    }
+
+    # 不访问云端和HA存储
+    async def async_get_channel_count(device):
+        return BENCH_CHANNEL_COUNT if device.model in CHANNEL_PROBED_MODELS else None
+
+    async def async_noop(*args, **kwargs):
+        pass
+
+    manager._async_get_channel_count = async_get_channel_count
+    manager._channel_cache.async_load = async_noop
+    manager.async_fetch_initial_values = async_noop
+
+    entry = BenchEntry()
+    models = mapping_models()
+    manager._entries_devices[entry.entry_id] = []
+    for i in range(devices):
+        device = AiotDevice(
+            did=f"lumi.{i:012x}", model=models[i % len(models)], deviceName=str(i)
+        )
+        manager._managed_devices[device.did] = device
+        manager._entries_devices[entry.entry_id].append(device.did)
+
+    entities = []
+
+    def async_add_entities(new_entities, update_before_add=False):
+        entities.extend(new_entities)
+
+    for platform in PLATFORMS:
+        module = importlib.import_module(f"custom_components.aqara_bridge.{platform}")
+        await module.async_setup_entry(hass, entry, async_add_entities)
+    return manager, [x for x in entities if isinstance(x, AiotEntityBase)]
+
+
+def percentile(samples: list, p: float) -> float:
+    samples = sorted(samples)
+    return samples[max(0, int(round(p / 100 * len(samples))) - 1)]
+
+
+async def async_replay(manager, messages: list) -> tuple:
+    """返回(总耗时, 每条消息的耗时列表)"""
+    latencies = []
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for msg in messages:
+        t = perf_counter()
+        await manager._msg_callback(msg)
+        latencies.append(perf_counter() - t)
+    return perf_counter() - start, latencies
+
+
+async def async_replay_allocations(manager, messages: list) -> tuple:
+    """返回(分配的峰值内存, 保留的内存, gen0回收次数)"""
+    gc.collect()
+    collections = gc.get_stats()[0]["collections"]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for msg in messages:
+        await manager._msg_callback(msg)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (
+        peak - before,
+        current - before,
+        gc.get_stats()[0]["collections"] - collections,
+    )
+
+
+async def async_main(args) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    errors = ErrorCounter()
+    logging.getLogger("custom_components.aqara_bridge").addHandler(errors)
+    logging.getLogger("custom_components.aqara_bridge").propagate = False
+
+    state_writes = StateWriteCounter()
+    AiotEntityBase.schedule_update_ha_state = state_writes
+
+    manager, entities = await async_build_manager(args.devices, args.coalesce)
+    messages = load_messages(args, manager, BENCH_EVENT_RATIO)
+
+    print(
+        f"{len(manager._devices_entities)} devices, {len(entities)} entities, "
+        f"{len(manager._resource_dispatch)} resources, {len(messages)} messages"
+    )
+
+    # 预热一次，排除首次调用的开销
+    await async_replay(manager, messages[: min(len(messages), 500)])
+    state_writes.count = 0
+    errors.count = 0
+
+    results = [await async_replay(manager, messages) for _ in range(args.repeat)]
+    total, latencies = min(results, key=lambda x: x[0])
+    writes = state_writes.count // args.repeat
+    failed = errors.count // args.repeat
+    peak, retained, collections = await async_replay_allocations(manager, messages)
+
+    throughput = len(messages) / total
+    p50 = percentile(latencies, 50) * 1000
+    p95 = percentile(latencies, 95) * 1000
+    p99 = percentile(latencies, 99) * 1000
+    print(f"  throughput: {throughput:10.0f} msg/s ({total * 1000:.1f} ms)")
+    print(f"  latency ms: p50 {p50:.4f}  p95 {p95:.4f}  p99 {p99:.4f}")
+    print(f"state writes: {writes} ({writes / len(messages):.2f}/msg)")
+    print(f"      errors: {failed}")
+    print(
+        f" allocations: peak {peak / 1024:.1f} KiB, retained {retained / 1024:.1f} KiB, "
+        f"{collections} gen0 collections"
+    )
+
+    status = 0
+    if args.min_throughput and throughput < args.min_throughput:
+        print(f"FAIL: throughput below {args.min_throughput} msg/s")
+        status = 1
+    if args.max_p99 and p99 > args.max_p99:
+        print(f"FAIL: p99 latency above {args.max_p99} ms")
+        status = 1
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_message_args(parser)
+    parser.add_argument(
+        "--coalesce", type=float, default=0, help="coalescing window in seconds"
+    )
+    parser.add_argument("--min-throughput", type=float, help="msg/s")
+    parser.add_argument("--max-p99", type=float, help="ms")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(async_main(args)))
+
+
+if __name__ == "__main__":
+    main()
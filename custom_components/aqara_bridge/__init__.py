@@ -5,7 +5,7 @@ import logging
 
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.helpers import aiohttp_client
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
 
 from .core.aiot_manager import (
     AiotManager,
@@ -56,11 +56,15 @@ def gen_auth_entry(
 def init_hass_data(hass):
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN].setdefault(HASS_DATA_AUTH_ENTRY_ID, None)
-    session = AiotCloud(aiohttp_client.async_create_clientsession(hass))
     if not hass.data[DOMAIN].get(HASS_DATA_AIOTCLOUD):
-        hass.data[DOMAIN].setdefault(HASS_DATA_AIOTCLOUD, session)
+        # AiotCloud自己维护长连接会话，HA关闭时释放
+        session = AiotCloud()
+        hass.data[DOMAIN][HASS_DATA_AIOTCLOUD] = session
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, session.async_close)
     if not hass.data[DOMAIN].get(HASS_DATA_AIOT_MANAGER):
-        hass.data[DOMAIN].setdefault(HASS_DATA_AIOT_MANAGER, AiotManager(hass, session))
+        hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER] = AiotManager(
+            hass, hass.data[DOMAIN][HASS_DATA_AIOTCLOUD]
+        )
 
 
 async def async_setup(hass, config):
@@ -76,6 +80,10 @@ async def async_setup_entry(hass, entry):
             data = auth_entry.data.copy()
             data[CONF_ENTRY_AUTH_ACCESS_TOKEN] = access_token
             data[CONF_ENTRY_AUTH_REFRESH_TOKEN] = refresh_token
+            if aiotcloud.expires_time:
+                data[CONF_ENTRY_AUTH_EXPIRES_TIME] = aiotcloud.expires_time.strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
             hass.config_entries.async_update_entry(entry, data=data)
 
     # add update handler
@@ -95,6 +103,10 @@ async def async_setup_entry(hass, entry):
     manager: AiotManager = hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER]
     aiotcloud: AiotCloud = hass.data[DOMAIN][HASS_DATA_AIOTCLOUD]
     aiotcloud.set_options(entry.options)
+    if CONF_MSG_COALESCE_WINDOW in entry.options:
+        manager.set_coalesce_window(entry.options[CONF_MSG_COALESCE_WINDOW])
+    if CONF_WRITE_BATCH_SIZE in entry.options:
+        manager.set_write_batch_size(entry.options[CONF_WRITE_BATCH_SIZE])
     aiotcloud.set_app_id(data[CONF_ENTRY_APP_ID])
     aiotcloud.set_app_key(data[CONF_ENTRY_APP_KEY])
     aiotcloud.set_key_id(data[CONF_ENTRY_KEY_ID])
@@ -105,34 +117,34 @@ async def async_setup_entry(hass, entry):
     await manager.start_msg_hanlder(
         data[CONF_ENTRY_APP_ID], data[CONF_ENTRY_APP_KEY], data[CONF_ENTRY_KEY_ID]
     )
-    if (
-        datetime.datetime.strptime(
-            data.get(CONF_ENTRY_AUTH_EXPIRES_TIME), "%Y-%m-%d %H:%M:%S"
-        )
-        <= datetime.datetime.now()
-    ):
-        resp = aiotcloud.async_refresh_token(data.get(CONF_ENTRY_AUTH_REFRESH_TOKEN))
-        if isinstance(resp, dict) and resp["code"] == 0:
-            auth_entry = gen_auth_entry(
-                data.get(CONF_ENTRY_AUTH_ACCOUNT),
-                data.get(CONF_ENTRY_AUTH_ACCOUNT_TYPE),
-                data.get(CONF_ENTRY_AUTH_COUNTRY_CODE),
-                resp["result"],
-            )
-            hass.config_entries.async_update_entry(entry, data=auth_entry)
-        else:
+    hass.data[DOMAIN][HASS_DATA_AUTH_ENTRY_ID] = entry
+    expires_time = datetime.datetime.strptime(
+        data.get(CONF_ENTRY_AUTH_EXPIRES_TIME), "%Y-%m-%d %H:%M:%S"
+    )
+    aiotcloud.set_country(data.get(CONF_ENTRY_AUTH_COUNTRY_CODE))
+    aiotcloud.refresh_token = data.get(CONF_ENTRY_AUTH_REFRESH_TOKEN)
+    if expires_time <= datetime.datetime.now():
+        # 令牌已过期，刷新成功后token_updated会更新配置
+        aiotcloud.access_token = None
+        if not await aiotcloud.async_refresh_token_single_flight():
             # TODO 这里需要处理刷新令牌失败的情况
             return False
     else:
-        aiotcloud.set_country(data.get(CONF_ENTRY_AUTH_COUNTRY_CODE))
         aiotcloud.access_token = data.get(CONF_ENTRY_AUTH_ACCESS_TOKEN)
-        aiotcloud.refresh_token = data.get(CONF_ENTRY_AUTH_REFRESH_TOKEN)
-
-    hass.data[DOMAIN][HASS_DATA_AUTH_ENTRY_ID] = entry
+        aiotcloud.set_token_expires(expires_time)
 
     if len(manager.all_devices) == 0:
-        await manager.async_add_all_devices(entry)
-        await manager.async_forward_entry_setup(entry)
+        if await manager.async_restore_snapshot(entry):
+            # 用上次的设备快照直接创建实体，在后台与云端同步
+            await manager.async_forward_entry_setup(entry, fetch_initial_values=False)
+            entry.async_create_background_task(
+                hass,
+                manager.async_reconcile_devices(entry),
+                f"{DOMAIN}_reconcile_devices",
+            )
+        else:
+            await manager.async_add_all_devices(entry)
+            await manager.async_forward_entry_setup(entry)
     else:
         await manager.async_add_all_devices(entry)
 
@@ -149,10 +161,11 @@ async def async_unload_entry(hass, entry):
 
 
 async def async_remove_entry(hass, entry):
+    manager: AiotManager = hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER]
+    await manager.async_remove_snapshot(entry)
     if CONF_ENTRY_AUTH_ACCOUNT in entry.data:
         hass.data[DOMAIN][HASS_DATA_AUTH_ENTRY_ID] = None
     else:
-        manager: AiotManager = hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER]
         await manager.async_remove_entry(entry)
     return True
 
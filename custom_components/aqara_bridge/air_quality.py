@@ -4,6 +4,7 @@ from homeassistant.const import (
     ATTR_TEMPERATURE
 )
 
+from .core.aiot_codec import INT, LQI, VOLTAGE, scale
 from .core.aiot_manager import (
     AiotManager,
     AiotEntityBase,
@@ -47,6 +48,14 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 
 class AiotAirMonitorEntity(AiotEntityBase, AirQualityEntity):
     """ Air Monitor Entity"""
+    _res_codecs = {
+        "zigbee_lqi": LQI,
+        "voltage": VOLTAGE,
+        "co2e": scale(ndigits=1),
+        "temperature": scale(ndigits=1),
+        "humidity": scale(1, 100, 1),
+    }
+
     def __init__(self, hass, device, res_params, channel=None, **kwargs):
         AiotEntityBase.__init__(self, hass, device, res_params, TYPE, channel, **kwargs)
         self._attr_state_class = kwargs.get("state_class")
@@ -87,21 +96,6 @@ class AiotAirMonitorEntity(AiotEntityBase, AirQualityEntity):
         """Return the particulate matter 10 level."""
         return self._attr_particulate_matter_1_0
 
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "firmware_version":
-            return res_value
-        if res_name == "zigbee_lqi":
-            return int(res_value)
-        if res_name == "voltage":
-            return format(float(res_value) / 1000, '.3f')
-        if res_name == "co2e":
-            return round(float(res_value), 1)
-        if res_name == "temperature":
-            return round(float(res_value), 1)
-        if res_name == "humidity":
-            return round(float(res_value / 100), 1) 
-        return super().convert_res_to_attr(res_name, res_value)
-
     @property
     def extra_state_attributes(self):
         """Return the optional state attributes."""
@@ -123,6 +117,11 @@ class AiotAirMonitorEntity(AiotEntityBase, AirQualityEntity):
 class AiotTvocEntity(AiotAirMonitorEntity, AirQualityEntity):
     """Air Quality class for Aqara TVOC device."""
     _attr_tvoc_level = None
+    # 其余资源（如co2e）沿用AiotAirMonitorEntity的转换
+    _res_codecs = {
+        "tvoc_level": INT,
+        "humidity": scale(ndigits=1),
+    }
 
     @property
     def tvoc_level(self):
@@ -151,18 +150,3 @@ class AiotTvocEntity(AiotAirMonitorEntity, AirQualityEntity):
 
         return data
 
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "firmware_version":
-            return res_value
-        if res_name == "zigbee_lqi":
-            return int(res_value)
-        if res_name == "voltage":
-            return format(float(res_value) / 1000, '.3f')
-        if res_name == "tvoc_level":
-            return int(res_value)
-        if res_name == "temperature":
-            return round(float(res_value), 1)
-        if res_name == "humidity":
-            return round(float(res_value), 1)
-        return super().convert_res_to_attr(res_name, res_value)
-
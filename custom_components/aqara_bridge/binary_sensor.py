@@ -7,6 +7,7 @@ from homeassistant.components.binary_sensor import BinarySensorEntity
 from homeassistant.core_config import DATA_CUSTOMIZE
 from homeassistant.helpers.event import async_call_later
 
+from .core.aiot_codec import INT, LQI, VOLTAGE, nonzero
 from .core.aiot_manager import AiotEntityBase, AiotManager
 from .core.const import CONF_OCCUPANCY_TIMEOUT, DOMAIN, HASS_DATA_AIOT_MANAGER
 
@@ -30,23 +31,19 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 
 
 class AiotBinarySensorEntity(AiotEntityBase, BinarySensorEntity):
+    _res_codecs = {
+        "zigbee_lqi": LQI,
+        "voltage": VOLTAGE,
+        "exist": INT,
+        "moisture": nonzero(),
+        "smoke": nonzero(),
+        "gas": nonzero(),
+    }
+
     def __init__(self, hass, device, res_params, channel=None, **kwargs):
         AiotEntityBase.__init__(self, hass, device, res_params, TYPE, channel, **kwargs)
         self._extra_state_attributes.extend(["trigger_time", "trigger_dt"])
 
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "firmware_version":
-            return res_value
-        if res_name == "zigbee_lqi":
-            return int(res_value)
-        if res_name == "voltage":
-            return format(float(res_value) / 1000, ".3f")
-        if res_name == "exist":
-            return int(res_value)
-        if res_name in ["moisture", "smoke", "gas"]:
-            return int(res_value) != 0
-        return super().convert_res_to_attr(res_name, res_value)
-
     @property
     def is_on(self):
         """Return true if the binary sensor is on."""
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import re
 from homeassistant.components.climate import (
@@ -184,8 +185,10 @@ class AiotAirrtcAgl001Entity(AiotEntityBase, ClimateEntity):
         if hvac_mode == HVACMode.OFF:
             await self.async_set_res_value("ac_on_off", "0")
         if hvac_mode == HVACMode.HEAT:
-            await self.async_set_res_value("ac_mode", "0")
-            await self.async_set_res_value("ac_on_off", "1")
+            await asyncio.gather(
+                self.async_set_res_value("ac_mode", "0"),
+                self.async_set_res_value("ac_on_off", "1"),
+            )
         self._attr_hvac_mode = hvac_mode
         self.schedule_update_ha_state()
 
@@ -240,11 +243,12 @@ class AiotAirrtcPcacn2Entity(AiotEntityBase, ClimateEntity):
         if hvac_mode == HVACMode.OFF:
             await self.async_set_res_value("ac_on_off", "0")
         else:
-            await self.async_set_res_value(
-                "ac_mode", S3_MODE_ATTR_RES_MAPPING.get(hvac_mode)
-            )
+            writes = [
+                self.async_set_res_value("ac_mode", S3_MODE_ATTR_RES_MAPPING.get(hvac_mode))
+            ]
             if self._attr_hvac_mode == HVACMode.OFF:
-                await self.async_set_res_value("ac_on_off", "1")
+                writes.append(self.async_set_res_value("ac_on_off", "1"))
+            await asyncio.gather(*writes)
         self._attr_hvac_mode = hvac_mode
         self.schedule_update_ha_state()
 
@@ -304,11 +308,12 @@ class AiotAirrtcAcn02Entity(AiotEntityBase, ClimateEntity):
         if hvac_mode == HVACMode.OFF:
             await self.async_set_res_value("ac_on_off", "0")
         else:
-            await self.async_set_res_value(
-                "ac_mode", T1_MODE_ATTR_RES_MAPPING.get(hvac_mode)
-            )
+            writes = [
+                self.async_set_res_value("ac_mode", T1_MODE_ATTR_RES_MAPPING.get(hvac_mode))
+            ]
             if self._attr_hvac_mode == HVACMode.OFF:
-                await self.async_set_res_value("ac_on_off", "1")
+                writes.append(self.async_set_res_value("ac_on_off", "1"))
+            await asyncio.gather(*writes)
         self._attr_hvac_mode = hvac_mode
         self.schedule_update_ha_state()
 
@@ -11,6 +11,7 @@ from homeassistant.config_entries import (
 from homeassistant.core import callback
 
 from . import init_hass_data, data_masking, gen_auth_entry
+from .core.aiot_manager import MSG_COALESCE_WINDOW, WRITE_MAX_BATCH_SIZE
 from .core.const import *
 
 _LOGGER = logging.getLogger(__name__)
@@ -66,7 +67,7 @@ class AqaraBridgeFlowHandler(ConfigFlow, domain=DOMAIN):
             refresh_token = user_input.get(CONF_FIELD_REFRESH_TOKEN)
             if refresh_token and refresh_token != "":
                 resp = await self._session.async_refresh_token(refresh_token)
-                if resp["code"] == 0:
+                if resp and resp["code"] == 0:
                     auth_entry = gen_auth_entry(
                         self.app_id,
                         self.app_key,
@@ -86,7 +87,7 @@ class AqaraBridgeFlowHandler(ConfigFlow, domain=DOMAIN):
                     errors["base"] = "refresh_token_error"
             else:
                 resp = await self._session.async_get_auth_code(self.account, 0)
-                if resp["code"] == 0:
+                if resp and resp["code"] == 0:
                     return await self.async_step_get_token()
                 else:
                     errors["base"] = "auth_code_error"
@@ -141,7 +142,7 @@ class AqaraBridgeFlowHandler(ConfigFlow, domain=DOMAIN):
                 auth_code = user_input.get(CONF_FIELD_AUTH_CODE)
                 resp = await self._session.async_get_token(auth_code, self.account, 0)
 
-                if resp["code"] == 0:
+                if resp and resp["code"] == 0:
                     auth_entry = gen_auth_entry(
                         self.app_id,
                         self.app_key,
@@ -180,6 +181,31 @@ class OptionsFlowHandler(OptionsFlow):
         self._session = None
 
     async def async_step_init(self, user_input=None):
+        """重新登录账号，或修改消息和写入的调优选项"""
+        return self.async_show_menu(step_id="init", menu_options=["account", "tuning"])
+
+    async def async_step_tuning(self, user_input=None):
+        """调优选项单独保存，不需要重新登录"""
+        if isinstance(user_input, dict):
+            return self.async_create_entry(
+                title="", data={**self.config_entry.options, **user_input}
+            )
+        options = self.config_entry.options
+        config_scheme = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_MSG_COALESCE_WINDOW,
+                    default=options.get(CONF_MSG_COALESCE_WINDOW, MSG_COALESCE_WINDOW),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_WRITE_BATCH_SIZE,
+                    default=options.get(CONF_WRITE_BATCH_SIZE, WRITE_MAX_BATCH_SIZE),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+            }
+        )
+        return self.async_show_form(step_id="tuning", data_schema=config_scheme)
+
+    async def async_step_account(self, user_input=None):
         """Configure an aqara device through the Aqara Cloud."""
         errors = {}
         if isinstance(user_input, dict):
@@ -197,7 +223,7 @@ class OptionsFlowHandler(OptionsFlow):
             if refresh_token and refresh_token != "":
                 # 更新了token值
                 resp = await self._session.async_refresh_token(refresh_token)
-                if resp["code"] == 0:
+                if resp and resp["code"] == 0:
                     auth_entry = gen_auth_entry(
                         self._session.get_app_id(),
                         self._session.get_app_key(),
@@ -215,7 +241,7 @@ class OptionsFlowHandler(OptionsFlow):
                     errors["base"] = "refresh_token_error"
             else:
                 resp = await self._session.async_get_auth_code(self.account, 0)
-                if resp["code"] == 0:
+                if resp and resp["code"] == 0:
                     return await self.async_step_option_get_token()
                 else:
                     errors["base"] = "auth_code_error"
@@ -252,7 +278,7 @@ class OptionsFlowHandler(OptionsFlow):
                 }
             )
             return self.async_show_form(
-                step_id="init", data_schema=config_scheme, errors=errors
+                step_id="account", data_schema=config_scheme, errors=errors
             )
 
     async def async_step_option_get_token(self, user_input=None):
@@ -260,7 +286,7 @@ class OptionsFlowHandler(OptionsFlow):
         if user_input and CONF_FIELD_AUTH_CODE in user_input:
             auth_code = user_input.get(CONF_FIELD_AUTH_CODE)
             resp = await self._session.async_get_token(auth_code, self.account, 0)
-            if resp["code"] == 0:
+            if resp and resp["code"] == 0:
                 auth_entry = gen_auth_entry(
                     self._session.get_app_id(),
                     self._session.get_app_key(),
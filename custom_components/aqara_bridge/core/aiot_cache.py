@@ -0,0 +1,147 @@
+"""Persistent caches for the Aqara Bridge component."""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# 延迟写入存储的秒数，合并短时间内的多次修改
+CACHE_SAVE_DELAY = 10
+
+POSITION_CACHE_VERSION = 1
+POSITION_CACHE_KEY = f"{DOMAIN}.positions"
+# 位置名称的有效期，位置（房间）很少变化
+POSITION_CACHE_TTL = 7 * 24 * 3600
+POSITION_CACHE_MAX_SIZE = 1024
+
+CHANNEL_CACHE_VERSION = 1
+CHANNEL_CACHE_KEY = f"{DOMAIN}.channels"
+CHANNEL_CACHE_TTL = 7 * 24 * 3600
+CHANNEL_CACHE_MAX_SIZE = 1024
+
+DEVICE_SNAPSHOT_VERSION = 1
+DEVICE_SNAPSHOT_KEY = f"{DOMAIN}.devices"
+
+
+class AiotStoreCache:
+    """key -> value，带有效期和容量限制，并持久化到HA存储"""
+
+    def __init__(self, hass, version: int, key: str, ttl: int, max_size: int):
+        self._hass = hass
+        self._ttl = ttl
+        self._max_size = max_size
+        self._store = Store(hass, version, key)
+        # key -> (value, update_time)，按最近使用排序
+        self._items = OrderedDict()
+        self._loaded = False
+
+    async def async_load(self):
+        """从HA存储加载缓存，只加载一次"""
+        if self._loaded:
+            return
+        self._loaded = True
+        data = await self._store.async_load()
+        if not isinstance(data, dict):
+            return
+        now = time.time()
+        for key, (value, update_time) in data.get("items", {}).items():
+            if now - update_time < self._ttl:
+                self._items[key] = (value, update_time)
+        self._evict()
+
+    def get(self, key: str):
+        """获取缓存值，不存在或已过期返回None"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if time.time() - item[1] >= self._ttl:
+            self._items.pop(key)
+            self._async_schedule_save()
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def set(self, key: str, value):
+        """更新缓存值"""
+        if not key:
+            return
+        self._items[key] = (value, time.time())
+        self._items.move_to_end(key)
+        self._evict()
+        self._async_schedule_save()
+
+    def invalidate(self, keys: list = None):
+        """使缓存失效，keys为None时清空全部"""
+        if keys is None:
+            self._items.clear()
+        elif not any(key in self._items for key in keys):
+            return
+        else:
+            for key in keys:
+                self._items.pop(key, None)
+        _LOGGER.debug(f"{self._store.key} invalidated: {keys or 'all'}")
+        self._async_schedule_save()
+
+    def _evict(self):
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def _async_schedule_save(self):
+        self._store.async_delay_save(self._data_to_save, CACHE_SAVE_DELAY)
+
+    def _data_to_save(self) -> dict:
+        return {"items": {k: list(v) for k, v in self._items.items()}}
+
+
+class AiotPositionCache(AiotStoreCache):
+    """positionId -> positionName"""
+
+    def __init__(
+        self,
+        hass,
+        ttl: int = POSITION_CACHE_TTL,
+        max_size: int = POSITION_CACHE_MAX_SIZE,
+    ):
+        super().__init__(
+            hass, POSITION_CACHE_VERSION, POSITION_CACHE_KEY, ttl, max_size
+        )
+
+
+class AiotChannelCache(AiotStoreCache):
+    """did -> 多通道设备探测到的通道数量（FP2区域、VRF空调）"""
+
+    def __init__(
+        self,
+        hass,
+        ttl: int = CHANNEL_CACHE_TTL,
+        max_size: int = CHANNEL_CACHE_MAX_SIZE,
+    ):
+        super().__init__(hass, CHANNEL_CACHE_VERSION, CHANNEL_CACHE_KEY, ttl, max_size)
+
+
+class AiotDeviceSnapshot:
+    """配置对象上次获取的设备列表、资源名称和通道数量，启动时不访问云端直接创建实体"""
+
+    def __init__(self, hass, entry_id: str):
+        self._store = Store(
+            hass, DEVICE_SNAPSHOT_VERSION, f"{DEVICE_SNAPSHOT_KEY}.{entry_id}"
+        )
+
+    async def async_load(self) -> Optional[dict]:
+        """加载快照，没有时返回None"""
+        data = await self._store.async_load()
+        if not isinstance(data, dict):
+            return None
+        return data
+
+    def save(self, data: dict):
+        self._store.async_delay_save(lambda: data, CACHE_SAVE_DELAY)
+
+    async def async_remove(self):
+        await self._store.async_remove()
@@ -1,11 +1,24 @@
+import asyncio
+import datetime
 import hashlib
+import heapq
+import itertools
 import json
 import random
 import string
 import time
 import logging
 
-from aiohttp import ClientSession
+from aiohttp import (
+    ClientConnectionError,
+    ClientConnectorError,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
+from homeassistant.util.ssl import get_default_context
+
+from .aiot_metrics import AiotCloudMetrics
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -17,6 +30,159 @@ API_DOMAIN = {
     "GER": "open-ger.aqara.com",
 }
 
+# 连接池参数，只访问一个API域名
+CONNECTION_LIMIT = 20
+CONNECTION_LIMIT_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+# 请求超时（秒）
+REQUEST_TIMEOUT = 15
+CONNECT_TIMEOUT = 5
+
+# 批量查询时的并发请求数
+MAX_CONCURRENT_REQUESTS = 4
+# 单次查询的位置数量
+POSITION_BATCH_SIZE = 50
+# 单次查询资源名称的设备数量
+RESOURCE_NAME_BATCH_SIZE = 50
+# 单次查询资源值的设备数量
+RESOURCE_VALUE_BATCH_SIZE = 20
+
+# 请求优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0  # 用户控制、授权
+PRIORITY_STATE = 1  # 状态查询
+PRIORITY_DISCOVERY = 2  # 设备发现、历史等
+
+# 访问令牌到期前提前刷新的时间（秒）
+TOKEN_REFRESH_MARGIN = 30 * 60
+
+# 客户端限流，令牌桶每秒补充的请求数和桶容量
+REQUEST_RATE = 10
+REQUEST_BURST = 20
+
+
+class AiotRetryPolicy:
+    """请求重试策略，指数退避加随机抖动"""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        jitter: float = 0.5,
+        retry_codes: tuple = (),
+        retry_exceptions: tuple = (),
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 抖动比例，0~1
+        self.jitter = jitter
+        self.retry_codes = retry_codes
+        self.retry_exceptions = retry_exceptions
+
+    def get_delay(self, attempt: int) -> float:
+        """第attempt次失败后的等待时间"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    def should_retry_code(self, attempt: int, code) -> bool:
+        return attempt < self.max_attempts and code in self.retry_codes
+
+    def should_retry_exception(self, attempt: int, ex: Exception) -> bool:
+        return attempt < self.max_attempts and isinstance(ex, self.retry_exceptions)
+
+
+# 可重试的返回码，100：超时，500：服务器内部错误
+RETRY_CODES = (100, 500)
+
+# 幂等的查询请求，网络异常和可重试返回码都自动重试
+READ_RETRY_POLICY = AiotRetryPolicy(
+    retry_codes=RETRY_CODES,
+    retry_exceptions=(ClientConnectionError, asyncio.TimeoutError),
+)
+# 控制请求只在确认请求未发出（连接失败）时重试，避免重复执行
+WRITE_RETRY_POLICY = AiotRetryPolicy(retry_exceptions=(ClientConnectorError,))
+NO_RETRY_POLICY = AiotRetryPolicy(max_attempts=1)
+
+# intent前缀 -> 重试策略，匹配最长的前缀，未匹配的使用READ_RETRY_POLICY
+INTENT_RETRY_POLICIES = {
+    "write.": WRITE_RETRY_POLICY,
+    "config.auth.": NO_RETRY_POLICY,
+}
+
+
+def get_intent_priority(intent: str) -> int:
+    """根据intent获取请求优先级"""
+    if intent.startswith("write.") or intent.startswith("config.auth."):
+        return PRIORITY_INTERACTIVE
+    if intent == "query.resource.value":
+        return PRIORITY_STATE
+    return PRIORITY_DISCOVERY
+
+
+class AiotRequestScheduler:
+    """令牌桶限流，请求按优先级排队等待令牌，不丢弃请求"""
+
+    def __init__(self, rate: float = REQUEST_RATE, burst: int = REQUEST_BURST):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        # (priority, seq, future)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = None
+
+    @property
+    def queue_depth(self) -> int:
+        """排队等待的请求数"""
+        return sum(1 for x in self._waiters if not x[2].done())
+
+    def queue_depths(self) -> dict:
+        """各优先级排队等待的请求数"""
+        depths = {}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depths[priority] = depths.get(priority, 0) + 1
+        return depths
+
+    async def async_acquire(self, priority: int = PRIORITY_DISCOVERY):
+        """获取一个令牌，没有令牌时按优先级排队"""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def _dispatch(self):
+        self._wakeup = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # 等待中被取消
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+    def _schedule(self):
+        if self._wakeup is not None or not self._waiters:
+            return
+        delay = max(0.0, (1 - self._tokens) / self._rate)
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
 
 def get_random_string(length: int):
     seq = string.ascii_uppercase + string.digits
@@ -46,14 +212,50 @@ class AiotCloud:
     refresh_token = None
     update_token_event_callback = None
 
-    def __init__(self, session: ClientSession):
+    def __init__(self, session: ClientSession = None):
         self.app_id = None
         self.key_id = None
         self.app_key = None
         self.session = session
         self.options = None
+        self.scheduler = AiotRequestScheduler()
+        # 访问令牌过期时间
+        self.expires_time = None
+        self._refresh_task = None
+        self._refresh_timer = None
+        self.retry_policies = dict(INTENT_RETRY_POLICIES)
+        self.metrics = AiotCloudMetrics()
         self.set_country("CN")
 
+    def _get_session(self) -> ClientSession:
+        """获取长连接会话，没有则创建"""
+        if self.session is None or self.session.closed:
+            connector = TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                ssl=get_default_context(),
+            )
+            self.session = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+        return self.session
+
+    async def async_close(self, *args):
+        """关闭会话"""
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    @property
+    def queue_depth(self) -> int:
+        """等待发送的请求数"""
+        return self.scheduler.queue_depth
+
     def set_options(self, options):
         """set hass options"""
         self.options = options
@@ -85,6 +287,70 @@ class AiotCloud:
     def set_app_key(self, app_key: str):
         self.app_key = app_key
 
+    def set_retry_policy(self, intent_prefix: str, policy: AiotRetryPolicy):
+        """设置intent（或intent前缀）的重试策略"""
+        self.retry_policies[intent_prefix] = policy
+
+    def get_retry_policy(self, intent: str) -> AiotRetryPolicy:
+        """获取intent的重试策略"""
+        matched = None
+        for prefix in self.retry_policies:
+            if intent.startswith(prefix) and (
+                matched is None or len(prefix) > len(matched)
+            ):
+                matched = prefix
+        if matched is None:
+            return READ_RETRY_POLICY
+        return self.retry_policies[matched]
+
+    def set_token_expires(self, expires_time: datetime.datetime):
+        """设置访问令牌过期时间，并在到期前主动刷新"""
+        self.expires_time = expires_time
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+        if expires_time is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = (
+            expires_time - datetime.datetime.now()
+        ).total_seconds() - TOKEN_REFRESH_MARGIN
+        self._refresh_timer = loop.call_later(
+            max(0.0, delay), self._start_token_refresh
+        )
+
+    def _start_token_refresh(self):
+        self._refresh_timer = None
+        _LOGGER.info("Aiot token is about to expire, refreshing in advance.")
+        self._get_token_refresh_task()
+
+    def _get_token_refresh_task(self) -> asyncio.Future:
+        """获取进行中的令牌刷新任务，没有则创建，保证同时只有一个刷新请求"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(
+                self.async_refresh_token(self.refresh_token)
+            )
+        return self._refresh_task
+
+    async def async_refresh_token_single_flight(self) -> bool:
+        """等待共享的令牌刷新任务完成，返回是否刷新成功"""
+        jo = await asyncio.shield(self._get_token_refresh_task())
+        return isinstance(jo, dict) and jo.get("code") == 0
+
+    def _update_token(self, result: dict):
+        self.access_token = result["accessToken"]
+        self.refresh_token = result["refreshToken"]
+        if result.get("expiresIn"):
+            self.set_token_expires(
+                datetime.datetime.now()
+                + datetime.timedelta(seconds=int(result["expiresIn"]))
+            )
+        if self.update_token_event_callback:
+            self.update_token_event_callback(self.access_token, self.refresh_token)
+
     def _get_request_headers(self, need_access_token=True):
         """生成Headers"""
         nonce = get_random_string(16)
@@ -106,27 +372,67 @@ class AiotCloud:
         return headers
 
     async def _async_invoke_aqara_cloud_api(
-        self, intent: str, only_result: bool = True, list_data: bool = False, **kwargs
+        self,
+        intent: str,
+        only_result: bool = True,
+        list_data: bool = False,
+        data_list: list = None,
+        retry_on_expired: bool = True,
+        **kwargs,
     ):
-        """调用Aqara Api"""
+        """调用Aqara Api，data_list不为None时直接作为请求的data列表"""
         try:
             empty_keys = []
             for k, v in kwargs.items():
                 if v is None:
                     empty_keys.append(k)
             [kwargs.pop(x) for x in empty_keys]
-            payload = (
-                {"intent": intent, "data": [kwargs]}
-                if list_data
-                else {"intent": intent, "data": kwargs}
-            )
-            r = await self.session.post(
-                url=self.api_url,
-                data=json.dumps(payload),
-                headers=self._get_request_headers(),
-            )
-            raw = await r.read()
-            jo = json.loads(raw)
+            if data_list is not None:
+                payload = {"intent": intent, "data": data_list}
+            elif list_data:
+                payload = {"intent": intent, "data": [kwargs]}
+            else:
+                payload = {"intent": intent, "data": kwargs}
+            policy = self.get_retry_policy(intent)
+            attempt = 0
+            while True:
+                attempt += 1
+                await self.scheduler.async_acquire(get_intent_priority(intent))
+                access_token = self.access_token
+                start = time.monotonic()
+                try:
+                    r = await self._get_session().post(
+                        url=self.api_url,
+                        data=json.dumps(payload),
+                        headers=self._get_request_headers(),
+                    )
+                    raw = await r.read()
+                    jo = json.loads(raw)
+                except Exception as ex:
+                    self.metrics.record_request(
+                        intent, (time.monotonic() - start) * 1000, type(ex).__name__
+                    )
+                    if not policy.should_retry_exception(attempt, ex):
+                        raise
+                    self.metrics.record_retry(intent)
+                    delay = policy.get_delay(attempt)
+                    _LOGGER.warning(
+                        f"Call Aiot api {intent} error: {ex!r}, retry in {delay:.2f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                self.metrics.record_request(
+                    intent, (time.monotonic() - start) * 1000, jo.get("code")
+                )
+                if policy.should_retry_code(attempt, jo.get("code")):
+                    self.metrics.record_retry(intent)
+                    delay = policy.get_delay(attempt)
+                    _LOGGER.warning(
+                        f"Call Aiot api {intent} return code {jo.get('code')}, retry in {delay:.2f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                break
 
             if only_result:
                 # 这里的异常处理需要优化
@@ -135,15 +441,26 @@ class AiotCloud:
                     _LOGGER.warning(
                         f"Call Aiot api failed，request:{payload},return:{jo}"
                     )
-                    if jo["code"] == 108:
-                        # 令牌过期或异常，正在尝试自动刷新
-                        _LOGGER.warning(f"Aiot token expired, trying to auto refresh！")
-                        new_jo = await self.async_refresh_token(self.refresh_token)
-                        if new_jo["code"] == 0:
+                    if jo["code"] == 108 and retry_on_expired:
+                        # 令牌过期或异常，所有请求共享同一次刷新，刷新后只重试一次
+                        if access_token == self.access_token:
+                            _LOGGER.warning(
+                                f"Aiot token expired, trying to auto refresh！"
+                            )
+                            refreshed = await self.async_refresh_token_single_flight()
+                        else:
+                            # 请求发出后令牌已被刷新
+                            refreshed = True
+                        if refreshed:
                             # Aiot令牌更新成功！
                             _LOGGER.info(f"Aiot token refresh successfully！")
                             return await self._async_invoke_aqara_cloud_api(
-                                intent, only_result, list_data, **kwargs
+                                intent,
+                                only_result,
+                                list_data,
+                                data_list,
+                                retry_on_expired=False,
+                                **kwargs,
                             )
                         else:
                             # Aiot令牌更新失败，请重新授权
@@ -178,11 +495,8 @@ class AiotCloud:
             account=account,
             accountType=account_type,
         )
-        if jo["code"] == 0:
-            self.access_token = jo["result"]["accessToken"]
-            self.refresh_token = jo["result"]["refreshToken"]
-            if self.update_token_event_callback:
-                self.update_token_event_callback(self.access_token, self.refresh_token)
+        if jo and jo["code"] == 0:
+            self._update_token(jo["result"])
 
         return jo
 
@@ -193,11 +507,8 @@ class AiotCloud:
             only_result=False,
             refreshToken=refresh_token,
         )
-        if jo["code"] == 0:
-            self.access_token = jo["result"]["accessToken"]
-            self.refresh_token = jo["result"]["refreshToken"]
-            if self.update_token_event_callback:
-                self.update_token_event_callback(self.access_token, self.refresh_token)
+        if jo and jo["code"] == 0:
+            self._update_token(jo["result"])
         else:
             _LOGGER.error(
                 f"Call Aiot api refresh token failed，request:{refresh_token},return:{jo}"
@@ -210,14 +521,14 @@ class AiotCloud:
             intent="query.device.bindKey", did=did
         )
 
-    async def async_query_device_info(
+    async def _async_query_device_info_page(
         self,
         dids: list = None,
         position_id: str = None,
         page_num: int = None,
         page_size: int = None,
     ):
-        """查询设备信息"""
+        """查询设备信息，返回包含data和totalCount的完整结果"""
         resp = await self._async_invoke_aqara_cloud_api(
             intent="query.device.info",
             dids=dids,
@@ -225,24 +536,66 @@ class AiotCloud:
             pageNum=page_num,
             pageSize=page_size,
         )
-        if resp:
-            return resp.get("data")
-        return {}
+        return resp or {}
+
+    async def async_query_device_info(
+        self,
+        dids: list = None,
+        position_id: str = None,
+        page_num: int = None,
+        page_size: int = None,
+    ):
+        """查询设备信息"""
+        resp = await self._async_query_device_info_page(
+            dids, position_id, page_num, page_size
+        )
+        return resp.get("data") or []
 
     async def async_query_all_devices_info(self, page_size: int = 50):
-        """查询所有设备信息"""
-        continue_flag = True
-        page_num = 1
-        devices = []
-        while continue_flag:
-            jo = await self.async_query_device_info(
-                page_num=page_num, page_size=page_size
-            )
-            devices.extend(jo)
-            if len(jo) < page_size:
-                continue_flag = False
-            page_num = page_num + 1
-        return devices
+        """查询所有设备信息，首页返回总数后并发获取剩余分页
+
+        返回(设备列表, 是否完整)，有分页查询失败或数量与总数不一致时不完整
+        """
+        first = await self._async_query_device_info_page(
+            page_num=1, page_size=page_size
+        )
+        if not first:
+            return [], False
+        devices = list(first.get("data") or [])
+        total = first.get("totalCount")
+        if len(devices) < page_size:
+            return devices, not isinstance(total, int) or len(devices) == total
+
+        if not isinstance(total, int):
+            # 没有总数时按原方式逐页获取
+            page_num = 2
+            while True:
+                resp = await self._async_query_device_info_page(
+                    page_num=page_num, page_size=page_size
+                )
+                if not resp:
+                    return devices, False
+                jo = resp.get("data") or []
+                devices.extend(jo)
+                if len(jo) < page_size:
+                    return devices, True
+                page_num = page_num + 1
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        async def fetch_page(page_num):
+            async with semaphore:
+                return await self._async_query_device_info_page(
+                    page_num=page_num, page_size=page_size
+                )
+
+        page_count = (total + page_size - 1) // page_size
+        pages = await asyncio.gather(
+            *(fetch_page(x) for x in range(2, page_count + 1))
+        )
+        for resp in pages:
+            devices.extend(resp.get("data") or [])
+        return devices, all(pages) and len(devices) == total
 
     async def async_query_device_sub_info(self, did: str):
         """查询网关下子设备信息"""
@@ -263,6 +616,22 @@ class AiotCloud:
             resources=[{"subjectId": subject_id, "resourceIds": resource_ids}],
         )
 
+    async def async_query_resources_value(
+        self, resources: list, batch_size: int = RESOURCE_VALUE_BATCH_SIZE
+    ):
+        """批量并发查询多个设备的资源信息
+
+        resources: [{"subjectId": did, "resourceIds": [...]}, ...]
+        """
+        async def fetch(batch):
+            return await self._async_invoke_aqara_cloud_api(
+                intent="query.resource.value", resources=batch
+            )
+
+        return await self._async_gather_batches(
+            fetch, resources, batch_size, unique=False
+        )
+
     async def async_query_resource_history(
         self,
         subject_id: str,
@@ -291,6 +660,14 @@ class AiotCloud:
             subjectIds=subjectIds,
         )
 
+    async def async_query_resources_name(
+        self, subject_ids: list, batch_size: int = RESOURCE_NAME_BATCH_SIZE
+    ):
+        """批量并发查询多个设备的资源名称"""
+        return await self._async_gather_batches(
+            self.async_query_resource_name, subject_ids, batch_size
+        )
+
     async def async_write_resource_device(
         self, subject_id: str, resource_id: str, value: str
     ):
@@ -302,6 +679,15 @@ class AiotCloud:
             resources=[{"resourceId": resource_id, "value": value}],
         )
 
+    async def async_write_resources_devices(self, items: list):
+        """同时控制多个设备
+
+        items: [{"subjectId": did, "resources": [{"resourceId", "value"}]}, ...]
+        """
+        return await self._async_invoke_aqara_cloud_api(
+            intent="write.resource.device", data_list=items
+        )
+
     async def async_write_device_openconnect(self, subject_id: str):
         """开启网关添加子设备模式"""
         return await self._async_invoke_aqara_cloud_api(
@@ -362,3 +748,35 @@ class AiotCloud:
             intent="query.position.detail",
             positionIds=positionIds,
         )
+
+    async def async_query_positions_detail(
+        self, position_ids: list, batch_size: int = POSITION_BATCH_SIZE
+    ):
+        """批量并发查询位置信息，重复的位置只查询一次"""
+        return await self._async_gather_batches(
+            self.async_query_position_detail, position_ids, batch_size
+        )
+
+    async def _async_gather_batches(
+        self, func, items: list, batch_size: int, unique: bool = True
+    ):
+        """按batch_size分批并发调用func，合并返回的列表"""
+        if unique:
+            items = list(dict.fromkeys(x for x in items if x))
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        async def fetch_batch(batch):
+            async with semaphore:
+                return await func(batch)
+
+        results = await asyncio.gather(
+            *(
+                fetch_batch(items[i : i + batch_size])
+                for i in range(0, len(items), batch_size)
+            )
+        )
+        merged = []
+        for x in results:
+            if x:
+                merged.extend(x)
+        return merged
@@ -0,0 +1,128 @@
+"""Resource value codecs for the Aqara Bridge component.
+
+A codec converts a resource value reported by Aqara (usually a string) to the
+value of the HA attribute, and optionally back. Entity classes declare codecs
+per res_name in ``_res_codecs``, merged along the class hierarchy like the
+convert_res_to_attr chains they replace.
+"""
+
+from typing import Callable, NamedTuple, Optional
+
+
+class AiotCodec(NamedTuple):
+    # res_value -> attr_value
+    decode: Callable
+    # attr_value -> res_value，None表示不转换
+    encode: Optional[Callable] = None
+
+
+def cast(*types) -> AiotCodec:
+    """依次转换类型，如cast(float, int)"""
+    if len(types) == 1:
+        return AiotCodec(types[0])
+
+    def decode(value):
+        for t in types:
+            value = t(value)
+        return value
+
+    return AiotCodec(decode)
+
+
+def scale(
+    factor=1,
+    divisor=1,
+    ndigits: int = None,
+    type_=float,
+    result=None,
+    fmt: str = None,
+    encode=None,
+) -> AiotCodec:
+    """type_(value) * factor / divisor，再按ndigits取整、result转换或fmt格式化
+
+    encode不为None时，写入的值按 encode(attr_value * divisor / factor) 转换。
+    """
+
+    def _decode(value):
+        value = type_(value) * factor / divisor
+        if ndigits is not None:
+            return round(value, ndigits)
+        if result is not None:
+            return result(value)
+        if fmt is not None:
+            return format(value, fmt)
+        return value
+
+    _encode = None
+    if encode is not None:
+
+        def _encode(value):
+            return encode(value * divisor / factor)
+
+    return AiotCodec(_decode, _encode)
+
+
+def reciprocal(numerator, type_=int) -> AiotCodec:
+    """numerator / value，两个方向相同，如色温mired和kelvin互转"""
+
+    def convert(value):
+        return type_(numerator / int(value))
+
+    return AiotCodec(convert, convert)
+
+
+def boolean(true_value: str = "1", false_value: str = "0") -> AiotCodec:
+    """字符串开关量"""
+    return AiotCodec(
+        lambda value: value == true_value,
+        lambda value: true_value if value else false_value,
+    )
+
+
+def nonzero() -> AiotCodec:
+    """整数不为0即为True"""
+    return AiotCodec(lambda value: int(value) != 0)
+
+
+def passthrough(value):
+    return value
+
+
+# 常用的编解码器
+INT = cast(int)
+LQI = INT
+VOLTAGE = scale(1, 1000, fmt=".3f")
+ENERGY = scale(1, 1000, 3)
+TOGGLE = boolean()
+# 只读的开关量，写入时不转换
+FLAG = AiotCodec(TOGGLE.decode)
+
+
+_class_codecs = {}
+
+
+def get_class_codecs(cls) -> tuple:
+    """合并类继承链上声明的_res_codecs，返回(全部编解码器, 可直接调用的编解码器)
+
+    子类重写了convert_res_to_attr时，父类声明的编解码器可能被重写的逻辑改变，
+    只能通过convert_res_to_attr间接使用；重写它的类及其子类声明的可以直接调用。
+    """
+    codecs = _class_codecs.get(cls)
+    if codecs is not None:
+        return codecs
+    mro = cls.__mro__
+    owner = next(
+        (i for i, c in enumerate(mro) if "convert_res_to_attr" in c.__dict__),
+        len(mro) - 1,
+    )
+    all_codecs = {}
+    direct = {}
+    for i in range(len(mro) - 1, -1, -1):
+        declared = mro[i].__dict__.get("_res_codecs")
+        if not declared:
+            continue
+        all_codecs.update(declared)
+        if i <= owner:
+            direct.update(declared)
+    codecs = _class_codecs[cls] = (all_codecs, direct)
+    return codecs
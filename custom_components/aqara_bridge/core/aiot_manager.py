@@ -1,28 +1,87 @@
 import asyncio
 import json
 import logging
+import threading
+import time
 import traceback
 
-from typing import Optional, Union
+from collections import deque
+from functools import partial
+
+from typing import NamedTuple, Optional, Union
 from datetime import datetime
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers.entity import DeviceInfo, Entity
 
+from .aiot_cache import AiotChannelCache, AiotDeviceSnapshot, AiotPositionCache
+from .aiot_codec import TOGGLE, get_class_codecs, passthrough
 from .aiot_cloud import AiotCloud
-
-from .aiot_mapping import (
+from .aiot_metrics import AiotMessageMetrics
+from .aiot_model_index import AiotModelSpec, load_model_index
+from .const import (
+    DOMAIN,
+    HASS_DATA_AIOT_MANAGER,
     MK_MAPPING_PARAMS,
     MK_INIT_PARAMS,
     MK_RESOURCES,
     MK_HASS_NAME,
-    AIOT_DEVICE_MAPPING,
 )
-from .const import DOMAIN, HASS_DATA_AIOT_MANAGER
 from .utils import *
 
 _LOGGER = logging.getLogger(__name__)
 
+# 合并写入的等待时间（秒）
+WRITE_COALESCE_DELAY = 0.05
+# 一次write.resource.device请求最多包含的设备数量
+WRITE_MAX_BATCH_SIZE = 20
+
+# 需要探测通道数量的多通道设备，model -> 通道资源模板
+CHANNEL_PROBED_MODELS = {
+    "lumi.airrtc.vrfegl01": "14.{}.85",
+    "lumi.motion.agl001": "3.{}.85",
+}
+# 多通道设备最多支持的通道数量（FP2最多30个区域）
+MAX_PROBED_CHANNELS = 30
+
+# MQ线程和事件循环之间的消息队列容量
+MESSAGE_QUEUE_SIZE = 1000
+# 队列满时的处理方式：阻塞MQ线程直到有空间
+MESSAGE_OVERFLOW_BLOCK = "block"
+# 队列满时的处理方式：丢弃会被新消息覆盖的旧属性消息，没有可丢弃的再阻塞
+MESSAGE_OVERFLOW_DROP_SUPERSEDED = "drop_superseded"
+# 阻塞时每次等待的秒数，期间会检查队列是否已关闭
+MESSAGE_QUEUE_PUT_TIMEOUT = 1
+
+# 同一资源频繁上报时的合并窗口（秒），窗口内只分发最新值，0表示不合并
+MSG_COALESCE_WINDOW = 0
+# 每次上报都是一个变化量的资源（按MK_HASS_NAME），与事件类资源一样不能合并或丢弃
+DELTA_HASS_NAMES = frozenset({"rotation_angle", "press_rotation_angle"})
+
+# AiotDevice属性 -> query.device.info中的字段，用于设备快照和更新设备信息
+DEVICE_INFO_FIELDS = (
+    ("did", "did"),
+    ("parent_did", "parentDid"),
+    ("model", "model"),
+    ("model_type", "modelType"),
+    ("device_name", "deviceName"),
+    ("state", "state"),
+    ("timezone", "timeZone"),
+    ("firmware_version", "firmwareVersion"),
+    ("create_time", "createTime"),
+    ("update_time", "updateTime"),
+    ("position_id", "positionId"),
+)
+
+# 会影响位置信息的事件
+POSITION_CHANGE_EVENTS = (
+    "gateway_bind",
+    "subdevice_bind",
+    "gateway_unbind",
+    "unbind_sub_gw",
+)
+
 
 def __init_rocketmq():
     import platform, os
@@ -48,15 +107,58 @@ def __init_rocketmq():
         shutil.copyfile(fp, target_p)
 
 
-try:
-    from rocketmq.client import PushConsumer, RecvMessage
-except:
-    __init_rocketmq()
-    from rocketmq.client import PushConsumer, RecvMessage
+def load_push_consumer():
+    """加载RocketMQ客户端，首次加载时才准备librocketmq，会阻塞，需在线程中调用"""
+    try:
+        from rocketmq.client import PushConsumer
+    except:
+        __init_rocketmq()
+        from rocketmq.client import PushConsumer
+    return PushConsumer
+
+
+def load_model_specs(models):
+    """预先解码型号的映射信息，可能导入映射表和HA组件，会阻塞，需在线程中调用"""
+    index = load_model_index()
+    for model in models:
+        index.get(model)
+
+
+def get_model_spec(model: str) -> Optional[AiotModelSpec]:
+    return load_model_index().get(model)
+
+
+class AiotEntityDescriptor(NamedTuple):
+    """实体计划中的一个实体"""
+
+    device: "AiotDevice"
+    resources: dict
+    channel: Optional[int]
+    init_params: dict
 
 
 class AiotDevice:
-    def __init__(self, **kwargs):
+    __slots__ = (
+        "did",
+        "parent_did",
+        "model",
+        "model_type",
+        "device_name",
+        "state",
+        "timezone",
+        "firmware_version",
+        "create_time",
+        "update_time",
+        "position_id",
+        "position_name",
+        "platforms",
+        "manufacturer",
+        "heard_version",
+        "resource_names",
+        "model_spec",
+    )
+
+    def __init__(self, model_spec: AiotModelSpec = None, **kwargs):
         self.did = kwargs.get("did")
         self.parent_did = kwargs.get("parentDid")
         self.model = kwargs.get("model")
@@ -72,23 +174,64 @@ class AiotDevice:
         self.platforms = None
         self.manufacturer = None
         self.heard_version = None
-        self.resource_names = []
-        for device in AIOT_DEVICE_MAPPING:
-            if self.model in device:
-                self.platforms = device["params"]
-                self.manufacturer = device[self.model][0]
-                self.heard_version = device[self.model][2]
-                break
-        self.children = []
+        # resourceId -> 资源名称
+        self.resource_names = {}
+        self.model_spec = model_spec or get_model_spec(self.model)
+        if self.model_spec is not None:
+            self.platforms = self.model_spec.params
+            self.manufacturer = self.model_spec.manufacturer_info[0]
+            self.heard_version = self.model_spec.manufacturer_info[2]
 
     @property
     def is_supported(self):
         return self.platforms is not None
 
+    def get_platform_params(self, platform: str) -> tuple:
+        """获取设备在指定平台下的映射参数"""
+        if self.model_spec is None:
+            return ()
+        return self.model_spec.platform_params.get(platform, ())
+
     def get_resource_name(self, resource_id):
-        for r in self.resource_names:
-            if r["resourceId"] == resource_id:
-                return r["name"]
+        return self.resource_names.get(resource_id)
+
+    def as_info(self) -> dict:
+        """转换为query.device.info的格式，附带位置名称"""
+        info = {k: getattr(self, attr) for attr, k in DEVICE_INFO_FIELDS}
+        info["positionName"] = self.position_name
+        return info
+
+
+class AiotUnsupportedDevice(NamedTuple):
+    """插件不支持的设备，只保留列表展示需要的信息"""
+
+    did: str
+    model: str
+    model_type: int
+    device_name: str
+
+    is_supported = False
+
+    def as_info(self) -> dict:
+        return {
+            "did": self.did,
+            "model": self.model,
+            "modelType": self.model_type,
+            "deviceName": self.device_name,
+        }
+
+
+def create_device(info: dict):
+    """根据query.device.info的结果创建设备，不支持的型号只创建精简对象"""
+    model_spec = get_model_spec(info.get("model"))
+    if model_spec is None:
+        return AiotUnsupportedDevice(
+            info.get("did"),
+            info.get("model"),
+            info.get("modelType"),
+            info.get("deviceName"),
+        )
+    return AiotDevice(model_spec, **info)
 
 
 class AiotEntityBase(Entity):
@@ -96,17 +239,22 @@ class AiotEntityBase(Entity):
         self.hass = hass
         # 设备信息
         self._device = device
+        self._type_name = type_name
+        self._hass_attr_name = kwargs.get(MK_HASS_NAME)
         # 参数
         self._res_params = res_params
         self._attr_name = device.device_name
         self._position_name = device.position_name
         self._supported_resources = []
+        # resource_id -> res_name
+        self._resource_map = {}
         if kwargs.get("entity_name"):
             self._attr_name = kwargs.get("entity_name")
 
         for k, v in res_params.items():
             resource_id = v[0].format(channel)
             self._supported_resources.append(resource_id)
+            self._resource_map.setdefault(resource_id, k)
             # 获取资源名称
             resource_name = device.get_resource_name(resource_id)
             if resource_name is not None:
@@ -114,6 +262,7 @@ class AiotEntityBase(Entity):
             # 人体传感器多通道
             if device.model == "lumi.motion.agl001" and channel is not None:
                 self._attr_name = f"{self._attr_name} {channel}"
+        self._resolve_codecs()
         if self._position_name is None:
             self._attr_name = "%s-%s" % (self._position_name, self._attr_name)
 
@@ -168,6 +317,21 @@ class AiotEntityBase(Entity):
     def supported_resources(self) -> list:
         return self._supported_resources
 
+    @property
+    def resource_map(self) -> dict:
+        """resource_id到res_name的映射"""
+        return self._resource_map
+
+    @property
+    def type_name(self) -> str:
+        """实体所属的平台"""
+        return self._type_name
+
+    @property
+    def hass_attr_name(self) -> Optional[str]:
+        """映射表中的MK_HASS_NAME"""
+        return self._hass_attr_name
+
     @property
     def device(self) -> AiotDevice:
         return self._device
@@ -219,7 +383,7 @@ class AiotEntityBase(Entity):
                 self.device.did, res_id, value
             )
         )
-        return await self._aiot_manager.session.async_write_resource_device(
+        return await self._aiot_manager.async_write_resource(
             self.device.did, res_id, value
         )
 
@@ -258,6 +422,12 @@ class AiotEntityBase(Entity):
     async def async_query_resource_name(self, subjectIds):
         return await self._aiot_manager.session.async_query_resource_name(subjectIds)
 
+    def schedule_update_ha_state(self, force_refresh: bool = False):
+        """实体添加到HA之前不写入状态，添加时会写入初始状态"""
+        if self.platform is None:
+            return
+        super().schedule_update_ha_state(force_refresh)
+
     async def async_update(self):
         resp = await self.async_fetch_res_values()
         if resp:
@@ -289,21 +459,23 @@ class AiotEntityBase(Entity):
 
     async def async_set_attr(self, res_id, res_value, timestamp, write_ha_state=True):
         """设置ha attr的值"""
-        res_name = next(
-            k
-            for k, v in self._res_params.items()
-            if v[0].format(self.channel) == res_id
-        )
+        res_name = self._resource_map.get(res_id)
+        if res_name is None:
+            return
         self.trigger_time = round(int(timestamp) / 1000.00, 0)
         tup_res = self._res_params.get(res_name)
-        attr_value = self.convert_res_to_attr(res_name, res_value)
+        attr_value = self._res_decoders[res_name](res_value)
         current_value = getattr(self, tup_res[1], None)
 
-        _LOGGER.info(
-            "[set_attr, {}, {}]{}, {}:{}".format(
-                self.device.did, self._attr_name, self.trigger_dt, res_name, res_value
+        if _LOGGER.isEnabledFor(logging.INFO):
+            _LOGGER.info(
+                "[set_attr, %s, %s]%s, %s:%s",
+                self.device.did,
+                self._attr_name,
+                self.trigger_dt,
+                res_name,
+                res_value,
             )
-        )
         if current_value != attr_value:
             self.__setattr__(tup_res[1], attr_value)
             if write_ha_state:
@@ -337,16 +509,42 @@ class AiotEntityBase(Entity):
             self.device.did, keyid
         )
 
+    def _resolve_codecs(self):
+        """为每个资源确定一次转换函数，收到上报时直接调用"""
+        codecs, direct = get_class_codecs(type(self))
+        overridden = (
+            type(self).convert_res_to_attr is not AiotEntityBase.convert_res_to_attr
+        )
+        self._codecs = codecs
+        # res_name -> res_value到attr_value的转换函数
+        self._res_decoders = {}
+        for k in self._res_params:
+            if k in direct:
+                self._res_decoders[k] = direct[k].decode
+            elif overridden or k in codecs:
+                self._res_decoders[k] = partial(self.convert_res_to_attr, k)
+            else:
+                self._res_decoders[k] = passthrough
+
     def convert_attr_to_res(self, res_name, attr_value):
         """从attr转换到res"""
+        codec = self._codecs.get(res_name)
+        if codec is not None and codec.encode is not None:
+            return codec.encode(attr_value)
         return attr_value
 
     def convert_res_to_attr(self, res_name, res_value):
         """从res转换到attr"""
+        codec = self._codecs.get(res_name)
+        if codec is not None:
+            return codec.decode(res_value)
         return res_value
 
 
 class AiotToggleableEntityBase(AiotEntityBase):
+    # toggle：0或1，字符串
+    _res_codecs = {"toggle": TOGGLE}
+
     def __init__(self, hass, device, res_params, type_name, channel, **kwargs):
         super().__init__(hass, device, res_params, type_name, channel=channel, **kwargs)
         self._attr_is_on = False
@@ -357,37 +555,221 @@ class AiotToggleableEntityBase(AiotEntityBase):
     async def async_turn_off(self, **kwargs):
         await self.async_set_resource("toggle", False)
 
-    def convert_attr_to_res(self, res_name, attr_value):
-        if res_name == "toggle":
-            # res_value：bool
-            return "1" if attr_value else "0"
-        return super().convert_attr_to_res(res_name, attr_value)
 
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "toggle":
-            # res_value：0或1，字符串
-            return res_value == "1"
-        return super().convert_res_to_attr(res_name, res_value)
+class AiotCommandQueue:
+    """合并短时间内多个实体的写入，按设备分组后用一次write.resource.device发送"""
+
+    def __init__(
+        self,
+        session: AiotCloud,
+        delay: float = WRITE_COALESCE_DELAY,
+        max_batch_size: int = WRITE_MAX_BATCH_SIZE,
+    ):
+        self._session = session
+        self._delay = delay
+        self.max_batch_size = max_batch_size
+        # did -> {resource_id: value}，同一资源只保留最后一次写入
+        self._pending = {}
+        # did -> [future]
+        self._waiters = {}
+        self._timer = None
+        # 正在发送的请求，保留引用避免任务被回收
+        self._tasks = set()
+
+    async def async_write(self, did: str, resource_id: str, value):
+        """写入资源值，返回该设备在合并请求中的结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        resources = self._pending.setdefault(did, {})
+        # 重新插入，保证资源按最后写入的顺序发送
+        resources.pop(resource_id, None)
+        resources[resource_id] = value
+        self._waiters.setdefault(did, []).append(future)
+        if self._timer is None:
+            self._timer = loop.call_later(self._delay, self._flush)
+        return await future
+
+    def _flush(self):
+        self._timer = None
+        pending = list(self._pending.items())
+        waiters = self._waiters
+        self._pending = {}
+        self._waiters = {}
+        batch_size = max(1, self.max_batch_size)
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i : i + batch_size]
+            task = asyncio.ensure_future(
+                self._async_send(batch, {k: waiters.pop(k) for k, _ in batch})
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _async_send(self, batch: list, waiters: dict):
+        items = [
+            {
+                "subjectId": did,
+                "resources": [
+                    {"resourceId": k, "value": v} for k, v in resources.items()
+                ],
+            }
+            for did, resources in batch
+        ]
+        _LOGGER.info(f"[command_queue]items:{items}")
+        try:
+            resp = await self._session.async_write_resources_devices(items)
+        except asyncio.CancelledError:
+            for futures in waiters.values():
+                for future in futures:
+                    future.cancel()
+            raise
+        except Exception as ex:
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(ex)
+            return
+
+        # 结果中带有subjectId时分发给对应设备，否则所有设备共享同一结果
+        results = {}
+        if isinstance(resp, list):
+            for x in resp:
+                if isinstance(x, dict) and x.get("subjectId"):
+                    results[x["subjectId"]] = x
+        for did, futures in waiters.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(did, resp))
+
+
+def get_report_keys(msg: dict) -> Optional[set]:
+    """属性消息中的(subjectId, resourceId)集合，其他消息返回None"""
+    if not msg.get("msgType"):
+        return None
+    return {(x["subjectId"], x["resourceId"]) for x in msg.get("data", [])}
+
+
+class AiotMessageQueue:
+    """MQ线程和事件循环之间的有界队列，由事件循环中的一个任务按顺序消费"""
+
+    def __init__(
+        self,
+        loop,
+        callback,
+        metrics: AiotMessageMetrics,
+        max_size: int = MESSAGE_QUEUE_SIZE,
+        overflow: str = MESSAGE_OVERFLOW_DROP_SUPERSEDED,
+        is_event_resource=None,
+    ):
+        self._loop = loop
+        self._callback = callback
+        self._metrics = metrics
+        self._max_size = max_size
+        self._overflow = overflow
+        self._is_event_resource = is_event_resource or (lambda key: False)
+        # (msg, received_at)
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._wakeup = asyncio.Event()
+        self._idle = False
+        self._closed = False
+        self._task = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        self._task = self._loop.create_task(self._async_consume())
+
+    def stop(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    def put(self, msg: dict, received_at: float):
+        """在MQ线程中调用，队列满时按溢出策略丢弃旧消息或阻塞"""
+        with self._cond:
+            while len(self._items) >= self._max_size and not self._closed:
+                if (
+                    self._overflow == MESSAGE_OVERFLOW_DROP_SUPERSEDED
+                    and self._drop_superseded(msg)
+                ):
+                    break
+                self._metrics.blocked += 1
+                self._cond.wait(MESSAGE_QUEUE_PUT_TIMEOUT)
+            if self._closed:
+                return
+            self._items.append((msg, received_at))
+            self._metrics.record_queue_depth(len(self._items))
+            wakeup = self._idle
+            self._idle = False
+        if wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _drop_superseded(self, msg: dict) -> bool:
+        """丢弃最早一条所有值都会被新消息覆盖的属性消息，事件类和变化量资源不丢弃"""
+        keys = get_report_keys(msg)
+        if not keys or any(self._is_event_resource(x) for x in keys):
+            return False
+        for i, (queued, _) in enumerate(self._items):
+            queued_keys = get_report_keys(queued)
+            if queued_keys and queued_keys <= keys:
+                del self._items[i]
+                self._metrics.dropped += 1
+                return True
+        return False
+
+    async def _async_consume(self):
+        while True:
+            with self._cond:
+                if self._items:
+                    item = self._items.popleft()
+                    self._metrics.queue_depth = len(self._items)
+                    self._cond.notify()
+                else:
+                    item = None
+                    self._idle = True
+                    self._wakeup.clear()
+            if item is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._callback(*item)
+            except Exception:
+                _LOGGER.exception("[msg_queue, error]process_message_error.")
 
 
 class AiotMessageHandler:
-    def __init__(self, loop, app_id, app_key, key_id):
+    def __init__(self, loop, app_id, app_key, key_id, metrics=None):
         self._server = "3rd-subscription.aqara.cn:9876"
         self._app_id = app_id
         self._app_key = app_key
         self._key_id = key_id
         self._loop = loop
-        self._consumer = PushConsumer(app_id)
+        self._metrics = metrics or AiotMessageMetrics()
+        self._queue = None
+        self._consumer = None
+
+    async def start(self, callback, is_event_resource=None):
+        # librocketmq在启动消息订阅时才加载
+        push_consumer = await asyncio.to_thread(load_push_consumer)
+        self._consumer = push_consumer(self._app_id)
         self._consumer.set_namesrv_addr(self._server)
-        self._consumer.set_session_credentials(key_id, app_key, "")
-
-    async def start(self, callback):
-        def consumer_callback(msg: RecvMessage):
-            asyncio.set_event_loop(self._loop)
-            asyncio.run_coroutine_threadsafe(
-                callback(json.loads(str(msg.body, "utf-8"))),
-                self._loop,
-            )
+        self._consumer.set_session_credentials(self._key_id, self._app_key, "")
+        self._queue = AiotMessageQueue(
+            self._loop,
+            callback,
+            self._metrics,
+            is_event_resource=is_event_resource,
+        )
+        self._queue.start()
+
+        def consumer_callback(msg):
+            received_at = time.time()
+            self._metrics.record_received()
+            # 消息体只解析一次，json.loads可以直接解析utf-8字节
+            self._queue.put(json.loads(msg.body), received_at)
 
         self._consumer.subscribe(self._app_id, consumer_callback)
         await asyncio.to_thread(self._consumer.start)
@@ -399,7 +781,10 @@ class AiotMessageHandler:
         )
 
     def stop(self):
-        self._consumer.shutdown()
+        if self._consumer is not None:
+            self._consumer.shutdown()
+        if self._queue is not None:
+            self._queue.stop()
 
 
 class AiotManager:
@@ -429,6 +814,33 @@ class AiotManager:
         self._session = session
         self._msg_handler = None
         self._options = None
+        # 消息分发表，(subjectId, resourceId) -> [(entity, res_name)]
+        self._resource_dispatch: dict[tuple, list] = {}
+        # 事件类资源（按键、事件、摄像头检测）和变化量资源，(subjectId, resourceId)
+        self._event_resources: set[tuple] = set()
+        # 配置对象的实体计划，entry_id -> {platform: [AiotEntityDescriptor]}
+        self._entries_plans: dict[str, dict] = {}
+        self._position_cache = AiotPositionCache(hass)
+        self._channel_cache = AiotChannelCache(hass)
+        self._command_queue = AiotCommandQueue(session)
+        self._msg_metrics = AiotMessageMetrics()
+        # 属性消息合并，(subjectId, resourceId) -> 最新的上报 / 窗口结束时间
+        self._coalesce_window = MSG_COALESCE_WINDOW
+        self._pending_reports = {}
+        self._coalesce_until = {}
+        # 下次清理_coalesce_until中过期窗口的时间
+        self._coalesce_sweep_at = 0.0
+        self._coalesce_task = None
+        # 设备资源名称缓存，did -> {resourceId: name}
+        self._resource_names = {}
+        # 尚未分发给实体的初始值，(subjectId, resourceId) -> [resource value, 待分发的实体数量]
+        self._initial_values = {}
+        # 设备快照，entry_id -> AiotDeviceSnapshot
+        self._snapshots = {}
+        # 已加载的平台，entry_id -> {platform: (cls_list, async_add_entities)}
+        self._entries_adders = {}
+        # 加载平台的任务，entry_id -> task
+        self._forward_tasks = {}
 
     @property
     def session(self) -> AiotCloud:
@@ -440,6 +852,11 @@ class AiotManager:
         """获取Aiot Cloud上的所有设备"""
         return self._all_devices.values()
 
+    @property
+    def managed_devices(self) -> Optional[list]:
+        """已添加到HA的设备"""
+        return self._managed_devices.values()
+
     @property
     def unmanaged_gateways(self) -> Optional[list]:
         """获取HA为管理的网关设备"""
@@ -458,54 +875,100 @@ class AiotManager:
         [devices.append(x) for x in self._all_devices.values() if not x.is_supported]
         return devices
 
+    async def async_write_resource(self, did: str, resource_id: str, value):
+        """写入设备资源，短时间内的写入会合并为一次请求"""
+        return await self._command_queue.async_write(did, resource_id, value)
+
+    @property
+    def command_queue(self) -> AiotCommandQueue:
+        """设备写入队列"""
+        return self._command_queue
+
+    def set_write_batch_size(self, size: int):
+        """设置一次写入请求最多包含的设备数量"""
+        self._command_queue.max_batch_size = max(1, int(size))
+
     async def start_msg_hanlder(self, app_id, app_key, key_id):
         self._msg_handler = AiotMessageHandler(
-            asyncio.get_event_loop(), app_id, app_key, key_id
+            asyncio.get_event_loop(), app_id, app_key, key_id, self._msg_metrics
         )
-        await self._msg_handler.start(self._msg_callback)
+        await self._msg_handler.start(self._msg_callback, self._is_event_resource)
 
-    async def _msg_callback(self, msg):
+    @property
+    def msg_metrics(self) -> AiotMessageMetrics:
+        """MQ消息链路统计"""
+        return self._msg_metrics
+
+    async def _msg_callback(self, msg, received_at: float = None):
+        if received_at is None:
+            received_at = time.time()
+        # 日志级别只判断一次，时间戳只在需要输出日志时才转换
+        log_info = _LOGGER.isEnabledFor(logging.INFO)
         try:
-            msg_time = ts_format_str_ms(msg.get("time"), self._hass)
             if msg.get("msgType"):
                 # 属性消息，resource_report
+                logged = False
                 for x in msg["data"]:
-                    entities = self._devices_entities.get(x["subjectId"])
-                    if entities:
-                        is_support = False
-                        for entity in entities:
-                            if x["resourceId"] in entity.supported_resources:
-                                _LOGGER.info(
-                                    "[msg_callback, {}]msg_time:{}, msg_data:{}".format(
-                                        "async_set_attr", msg_time, msg["data"]
-                                    )
-                                )
-                                is_support = True
-                                await entity.async_set_attr(
-                                    x["resourceId"], x["value"], x["time"]
-                                )
-                        if not is_support:
+                    key = (x["subjectId"], x["resourceId"])
+                    targets = self._resource_dispatch.get(key)
+                    known = x["subjectId"] in self._devices_entities
+                    self._msg_metrics.record_item(
+                        unknown_subject=not known, unsupported=known and not targets
+                    )
+                    if targets:
+                        if log_info and not logged:
+                            # 整条消息只输出一次
+                            logged = True
                             _LOGGER.info(
-                                "[msg_callback, unsupport_resources]{}, {}, {}:{}".format(
-                                    ts_format_str_ms(x["time"], self._hass),
-                                    x["subjectId"],
-                                    x["resourceId"],
-                                    x["value"],
-                                )
+                                "[msg_callback, async_set_attr]msg_time:%s, msg_data:%s",
+                                ts_format_str_ms(msg.get("time"), self._hass),
+                                msg["data"],
                             )
-                    else:
-                        _LOGGER.info(
-                            "[msg_callback, not_in_devices_entities]{}, {}".format(
-                                ts_format_str_ms(x["time"], self._hass), x
+                        if self._coalesce_report(key, x):
+                            continue
+                        for entity, _ in targets:
+                            await entity.async_set_attr(
+                                x["resourceId"], x["value"], x["time"]
                             )
+                    elif known:
+                        device = self._managed_devices.get(x["subjectId"])
+                        if device and self._is_channel_resource(
+                            device.model, x["resourceId"]
+                        ):
+                            # 新增了通道，下次启动时重新探测
+                            self._channel_cache.invalidate([x["subjectId"]])
+                        if log_info:
+                            _LOGGER.info(
+                                "[msg_callback, unsupport_resources]%s, %s, %s:%s",
+                                ts_format_str_ms(x["time"], self._hass),
+                                x["subjectId"],
+                                x["resourceId"],
+                                x["value"],
+                            )
+                    elif log_info:
+                        _LOGGER.info(
+                            "[msg_callback, not_in_devices_entities]%s, %s",
+                            ts_format_str_ms(x["time"], self._hass),
+                            x,
                         )
             elif msg.get("eventType"):
-                _LOGGER.info(
-                    "[msg_callback, {}]msg_time:{}, msg_data:{}".format(
-                        msg.get("eventType"), msg_time, msg["data"]
+                if log_info:
+                    _LOGGER.info(
+                        "[msg_callback, %s]msg_time:%s, msg_data:%s",
+                        msg.get("eventType"),
+                        ts_format_str_ms(msg.get("time"), self._hass),
+                        msg["data"],
                     )
-                )
                 # 事件消息
+                if msg["eventType"] in POSITION_CHANGE_EVENTS:
+                    # 设备绑定关系变化时，位置信息可能已经改变
+                    self._position_cache.invalidate(
+                        [
+                            x["positionId"]
+                            for x in msg["data"]
+                            if isinstance(x, dict) and x.get("positionId")
+                        ]
+                    )
                 if msg["eventType"] == "gateway_bind":  # 网关绑定
                     pass
                 elif msg["eventType"] == "subdevice_bind":  # 子设备绑定
@@ -524,30 +987,101 @@ class AiotManager:
                     pass
                 else:  # 其他事件暂不处理
                     pass
-            else:
+            elif log_info:
                 _LOGGER.info(
-                    "[msg_callback, {}]msg_time:{}, msg_data:{}".format(
-                        "unknown_message", msg_time, msg["data"]
-                    )
+                    "[msg_callback, unknown_message]msg_time:%s, msg_data:%s",
+                    ts_format_str_ms(msg.get("time"), self._hass),
+                    msg.get("data"),
                 )
         except Exception as _:
             _LOGGER.exception("[msg_callback, error]process_message_error.\n")
-
-    async def async_refresh_all_devices(self):
-        """获取Aiot所有设备"""
-        self._all_devices = {}
-        results = await self._session.async_query_all_devices_info()
-        for x in results:
-            device = AiotDevice(**x)
-            postions = await self._session.async_query_position_detail(
-                [device.position_id]
+        finally:
+            self._msg_metrics.record_handled(msg.get("time"), received_at)
+
+    def set_coalesce_window(self, window: float):
+        """设置属性消息的合并窗口（秒），0表示不合并"""
+        self._coalesce_window = max(0.0, float(window))
+        self._coalesce_until = {}
+
+    def _coalesce_report(self, key: tuple, item: dict) -> bool:
+        """同一资源在窗口内的多次上报只保留最新值，返回True表示已暂存稍后分发
+
+        窗口外的第一次上报立即分发，事件类和变化量资源总是立即分发。
+        """
+        if self._coalesce_window <= 0 or self._is_event_resource(key):
+            return False
+        now = time.monotonic()
+        if now >= self._coalesce_sweep_at:
+            # 每个窗口清理一次已过期的窗口，只保留最近上报过的资源
+            self._coalesce_until = {
+                k: v for k, v in self._coalesce_until.items() if v > now
+            }
+            self._coalesce_sweep_at = now + self._coalesce_window
+        until = self._coalesce_until.get(key, 0)
+        if until <= now:
+            self._coalesce_until[key] = now + self._coalesce_window
+            return False
+        if key in self._pending_reports:
+            self._msg_metrics.coalesced += 1
+        self._pending_reports[key] = item
+        if self._coalesce_task is None:
+            self._coalesce_task = asyncio.create_task(
+                self._async_flush_reports(until - now)
             )
-            device.position_name = postions[0]["positionName"]
-            self._all_devices.setdefault(x["did"], device)
+        return True
+
+    async def _async_flush_reports(self, delay: float):
+        """窗口结束后分发暂存的最新值"""
+        await asyncio.sleep(delay)
+        reports, self._pending_reports = self._pending_reports, {}
+        self._coalesce_task = None
+        until = time.monotonic() + self._coalesce_window
+        for key, x in reports.items():
+            self._coalesce_until[key] = until
+            for entity, _ in self._resource_dispatch.get(key, []):
+                try:
+                    await entity.async_set_attr(x["resourceId"], x["value"], x["time"])
+                except Exception:
+                    _LOGGER.exception("[msg_callback, error]flush_report_error.")
+
+    async def async_refresh_all_devices(self) -> bool:
+        """获取Aiot所有设备，返回设备列表是否完整"""
+        results, complete = await self._session.async_query_all_devices_info()
+        # 在线程中加载映射信息，避免阻塞事件循环
+        await asyncio.to_thread(load_model_specs, {x.get("model") for x in results})
+        # 获取完成后再替换，期间仍可使用原设备列表
+        all_devices = {}
+        for x in results:
+            if x["did"] not in all_devices:
+                all_devices[x["did"]] = create_device(x)
+        self._all_devices = all_devices
+
+        # 只有支持的设备需要位置名称
+        devices = [x for x in self._all_devices.values() if x.is_supported]
+        await self._position_cache.async_load()
+        missing = [
+            x.position_id
+            for x in devices
+            if self._position_cache.get(x.position_id) is None
+        ]
+        if missing:
+            positions = await self._session.async_query_positions_detail(missing)
+            for x in positions:
+                self._position_cache.set(x["positionId"], x["positionName"])
+        for device in devices:
+            device.position_name = self._position_cache.get(device.position_id)
+        return complete
 
     async def async_add_all_devices(self, config_entry: ConfigEntry):
         await self.async_refresh_all_devices()  # 刷新一次所有设备列表
-        self._entries_devices.setdefault(config_entry.entry_id, [])
+        self._add_entry_devices(config_entry)
+        # 重新加载时也更新在Aqara App中修改过的资源名称
+        await self.async_refresh_resource_names(refresh_all=True)
+
+    def _add_entry_devices(self, config_entry: ConfigEntry):
+        """将所有支持的设备交给ConfigEntry管理"""
+        self._entries_devices[config_entry.entry_id] = []
+        self._entries_plans.pop(config_entry.entry_id, None)
         self._config_entries[config_entry.entry_id] = config_entry
         for device in self.all_devices:
             # 这里看情况检查did是否已经存在，理论上来说应该不会重复，现在代码未做重复判断
@@ -560,118 +1094,433 @@ class AiotManager:
                 )
                 continue
 
-    async def async_forward_entry_setup(self, config_entry: ConfigEntry):
-        devices_in_entry = self._entries_devices[config_entry.entry_id]
-        platforms = []
-        for x in devices_in_entry:
-            if self._managed_devices[x].is_supported:
-                for i in range(len(self._managed_devices[x].platforms)):
-                    platforms.extend(self._managed_devices[x].platforms[i].keys())
+    async def async_restore_snapshot(self, config_entry: ConfigEntry) -> bool:
+        """从快照恢复设备列表、资源名称和通道数量，不访问云端。没有快照时返回False"""
+        data = await self._get_snapshot(config_entry.entry_id).async_load()
+        if not data or not data.get("devices"):
+            return False
+        infos = data["devices"]
+        await asyncio.to_thread(load_model_specs, {x.get("model") for x in infos})
+        self._all_devices = {}
+        for x in infos:
+            device = create_device(x)
+            if device.is_supported:
+                device.position_name = x.get("positionName")
+            self._all_devices[device.did] = device
+        self._resource_names = data.get("resource_names") or {}
+        await self._channel_cache.async_load()
+        for did, ch_count in (data.get("channels") or {}).items():
+            if ch_count is not None and self._channel_cache.get(did) is None:
+                self._channel_cache.set(did, ch_count)
+        self._add_entry_devices(config_entry)
+        return True
+
+    def _get_snapshot(self, entry_id: str) -> AiotDeviceSnapshot:
+        snapshot = self._snapshots.get(entry_id)
+        if snapshot is None:
+            snapshot = self._snapshots[entry_id] = AiotDeviceSnapshot(
+                self._hass, entry_id
+            )
+        return snapshot
+
+    def _save_snapshot(self, config_entry: ConfigEntry):
+        """保存设备快照，下次启动时直接用快照创建实体"""
+        dids = self._entries_devices.get(config_entry.entry_id, [])
+        self._get_snapshot(config_entry.entry_id).save(
+            {
+                "devices": [x.as_info() for x in self._all_devices.values()],
+                "resource_names": {
+                    x: self._resource_names[x]
+                    for x in dids
+                    if x in self._resource_names
+                },
+                "channels": {
+                    x: self._channel_cache.get(x)
+                    for x in dids
+                    if self._managed_devices[x].model in CHANNEL_PROBED_MODELS
+                },
+            }
+        )
+
+    async def async_reconcile_devices(self, config_entry: ConfigEntry):
+        """从快照启动后在后台与云端同步：获取实体的当前值，添加、移除或更新设备"""
+        entry_id = config_entry.entry_id
+        forward_task = self._forward_tasks.pop(entry_id, None)
+        if forward_task is not None:
+            await forward_task
+        await self.async_fetch_initial_values(
+            self._plan_descriptors(self._entries_plans.get(entry_id, {}))
+        )
+        await self._async_apply_initial_values(
+            [
+                entity
+                for did in self._entries_devices[entry_id]
+                for entity in self._devices_entities.get(did, [])
+            ],
+            write_ha_state=True,
+        )
+
+        snapshot_devices = self._all_devices
+        complete = await self.async_refresh_all_devices()
+        if not self._all_devices and snapshot_devices:
+            _LOGGER.warning(
+                "Failed to query Aqara devices, keep the devices from the snapshot."
+            )
+            self._all_devices = snapshot_devices
+            return
+        if not complete:
+            _LOGGER.warning(
+                "Aqara device list is incomplete, devices missing from it are kept."
+            )
+
+        removed = set()
+        managed = set(self._entries_devices[entry_id])
+        for did in managed:
+            device = self._managed_devices[did]
+            latest = self._all_devices.get(did)
+            if latest is None and not complete:
+                # 设备列表不完整时不能确定设备已删除，保留快照中的设备
+                self._all_devices[did] = device
+                continue
+            if latest is None or not latest.is_supported or latest.model != device.model:
+                removed.add(did)
+                continue
+            self._update_device(device, latest)
+            # 实体引用的是快照中的设备对象
+            self._all_devices[did] = device
+        added = [
+            x
+            for x in self._all_devices.values()
+            if x.is_supported and (x.did not in managed or x.did in removed)
+        ]
+        if removed:
+            _LOGGER.info(f"Remove Aqara devices: {removed}")
+            self._remove_devices(config_entry, removed)
+        # 保留的设备也更新在Aqara App中修改过的资源名称，新设备在添加时获取
+        await self.async_refresh_resource_names(refresh_all=True)
+        if added:
+            _LOGGER.info(f"Add Aqara devices: {[x.did for x in added]}")
+            await self._async_add_devices(config_entry, added)
+        self._save_snapshot(config_entry)
+
+    def _update_device(self, device: AiotDevice, latest: AiotDevice):
+        """用云端的最新信息更新设备，名称和固件版本同步到设备注册表"""
+        changed = set()
+        for attr, _ in DEVICE_INFO_FIELDS:
+            value = getattr(latest, attr)
+            if getattr(device, attr) != value:
+                setattr(device, attr, value)
+                changed.add(attr)
+        device.position_name = latest.position_name
+        if not changed & {"device_name", "firmware_version"}:
+            return
+        registry = dr.async_get(self._hass)
+        device_entry = registry.async_get_device(identifiers={(DOMAIN, device.did)})
+        if device_entry is not None:
+            registry.async_update_device(
+                device_entry.id,
+                name=device.device_name,
+                sw_version=device.firmware_version,
+            )
+
+    def _remove_devices(self, config_entry: ConfigEntry, dids: set):
+        """移除云端已不存在的设备，HA会同时移除设备的实体"""
+        entry_id = config_entry.entry_id
+        registry = dr.async_get(self._hass)
+        for did in dids:
+            self._managed_devices.pop(did, None)
+            self._entries_devices[entry_id].remove(did)
+            self._remove_device_entities(did)
+            self._resource_names.pop(did, None)
+            device_entry = registry.async_get_device(identifiers={(DOMAIN, did)})
+            if device_entry is not None:
+                registry.async_update_device(
+                    device_entry.id, remove_config_entry_id=entry_id
+                )
+        self._channel_cache.invalidate(list(dids))
+        for descriptors in self._entries_plans.get(entry_id, {}).values():
+            descriptors[:] = [x for x in descriptors if x.device.did not in dids]
+
+    async def _async_add_devices(self, config_entry: ConfigEntry, devices: list):
+        """添加新设备的实体，设备需要的平台未加载时先加载平台"""
+        entry_id = config_entry.entry_id
+        for device in devices:
+            self._managed_devices[device.did] = device
+            self._entries_devices[entry_id].append(device.did)
+        await self.async_refresh_resource_names()
+        plan = await self._async_build_plan(devices)
+        await self.async_fetch_initial_values(self._plan_descriptors(plan))
+
+        entry_plan = self._entries_plans.setdefault(entry_id, {})
+        adders = self._entries_adders.get(entry_id, {})
+        new_platforms = set()
+        for platform, descriptors in plan.items():
+            entry_plan.setdefault(platform, []).extend(descriptors)
+            if platform in adders:
+                await self._async_create_entities(descriptors, *adders[platform])
+            else:
+                new_platforms.add(platform)
+        if new_platforms:
+            async with config_entry.setup_lock:
+                await self._hass.config_entries.async_forward_entry_setups(
+                    config_entry, new_platforms
+                )
 
-        self._hass.async_create_task(
+    async def async_refresh_resource_names(self, refresh_all: bool = False):
+        """批量获取所有管理设备的资源名称，refresh_all时重新获取全部设备的名称"""
+        names = {} if refresh_all else self._resource_names
+        dids = [x for x in self._managed_devices if x not in names]
+        if dids:
+            results = await self._session.async_query_resources_name(dids)
+            for x in results:
+                names.setdefault(x["subjectId"], {})[x["resourceId"]] = x["name"]
+            # 没有资源名称的设备也记录下来，避免每次都重新查询；
+            # 查询失败时无法区分，保留原来的名称
+            for did in dids:
+                names.setdefault(did, self._resource_names.get(did, {}))
+        # 获取完成后再替换，期间仍可使用原来的名称
+        self._resource_names = names
+
+    async def async_forward_entry_setup(
+        self, config_entry: ConfigEntry, fetch_initial_values: bool = True
+    ):
+        plan = await self.async_build_entity_plan(config_entry, fetch_initial_values)
+        self._save_snapshot(config_entry)
+        # sensor平台总是加载，用于诊断传感器
+        self._forward_tasks[config_entry.entry_id] = self._hass.async_create_task(
             self._hass.config_entries.async_forward_entry_setups(
-                config_entry, set(platforms)
+                config_entry, set(plan) | {"sensor"}
             )
         )
 
+    async def async_build_entity_plan(
+        self, config_entry: ConfigEntry, fetch_initial_values: bool = True
+    ) -> dict:
+        """为ConfigEntry一次性生成所有平台的实体描述，platform -> [AiotEntityDescriptor]"""
+        devices = [
+            self._managed_devices[x]
+            for x in self._entries_devices[config_entry.entry_id]
+        ]
+        plan = await self._async_build_plan(devices)
+        self._entries_plans[config_entry.entry_id] = plan
+        if fetch_initial_values:
+            await self.async_fetch_initial_values(self._plan_descriptors(plan))
+        return plan
+
+    @staticmethod
+    def _plan_descriptors(plan: dict) -> list:
+        return [x for descriptors in plan.values() for x in descriptors]
+
+    async def _async_build_plan(self, devices: list) -> dict:
+        """生成设备的实体描述，platform -> [AiotEntityDescriptor]"""
+        # 多通道设备并发探测通道数量
+        await self._channel_cache.async_load()
+        await asyncio.gather(
+            *(
+                self._async_get_channel_count(x)
+                for x in devices
+                if x.model in CHANNEL_PROBED_MODELS
+            )
+        )
+
+        plan = {}
+        for device in devices:
+            device.resource_names = self._resource_names.get(device.did, {})
+            for platform, params in device.model_spec.platform_params.items():
+                descriptors = plan.setdefault(platform, [])
+                for j in range(len(params)):
+                    ch_count = None
+                    ch_start = None
+                    if params[j].get(MK_MAPPING_PARAMS):
+                        ch_count = params[j][MK_MAPPING_PARAMS].get("ch_count", None)
+                        ch_start = params[j][MK_MAPPING_PARAMS].get("ch_start", None)
+                    elif j == 0:
+                        # 这里需要处理多通道特殊设备
+                        ch_count = await self._async_get_channel_count(device)
+
+                    init_params = params[j].get(MK_INIT_PARAMS) or {}
+                    if ch_count:
+                        for i in range(ch_count):
+                            descriptors.append(
+                                AiotEntityDescriptor(
+                                    device,
+                                    params[j][MK_RESOURCES],
+                                    i + (ch_start or 1),
+                                    init_params,
+                                )
+                            )
+                    else:
+                        descriptors.append(
+                            AiotEntityDescriptor(
+                                device, params[j][MK_RESOURCES], None, init_params
+                            )
+                        )
+        return plan
+
     async def async_add_entities(
         self, config_entry: ConfigEntry, entity_type: str, cls_list, async_add_entities
     ):
-        """根据ConfigEntry创建Entity"""
-        devices = []
-        for x in self._entries_devices[config_entry.entry_id]:
-            for i in range(len(self._managed_devices[x].platforms)):
-                # if any one entity_type exist, append device
-                if entity_type in self._managed_devices[x].platforms[i]:
-                    devices.append(self._managed_devices[x])
-                    break
+        """根据ConfigEntry的实体计划创建Entity"""
+        plan = self._entries_plans.get(config_entry.entry_id)
+        if plan is None:
+            plan = await self.async_build_entity_plan(config_entry)
+        # 记录平台的添加方法，后台同步时添加新设备的实体
+        self._entries_adders.setdefault(config_entry.entry_id, {})[entity_type] = (
+            cls_list,
+            async_add_entities,
+        )
+        await self._async_create_entities(
+            plan.get(entity_type, []), cls_list, async_add_entities
+        )
 
+    async def _async_create_entities(
+        self, descriptors: list, cls_list, async_add_entities
+    ):
         entities = []
-        for device in devices:
-            params = []
-            self._devices_entities.setdefault(device.did, [])
-            for aiot_device in AIOT_DEVICE_MAPPING:
-                if device.model in aiot_device:
-                    for p in aiot_device["params"]:
-                        if entity_type in p:
-                            params.append(p[entity_type])
-                    break
-            device.resource_names = await self._session.async_query_resource_name(
-                [device.did]
-            )
-            for j in range(len(params)):
-                ch_count = None
-                ch_start = None
-                if j == 0:
-                    # 这里需要处理多通道特殊设备
-                    if device.model == "lumi.airrtc.vrfegl01":
-                        # VRF空调控制器
-                        resp = await self._session.async_query_resource_value(
-                            device.did, ["13.1.85"]
-                        )
-                        _LOGGER.info(f"resp: {resp}")
-                        ch_count = int(resp[0]["value"])
-                    elif device.model == "lumi.motion.agl001":
-                        # 人体场景传感器 FP2
-                        fp2_ch_count = 0
-                        for x in range(30):
-                            try_get = await self._session.async_query_resource_value(
-                                device.did, [f"3.{x + 1}.85"]
-                            )
-                            if not try_get:
-                                break
-                            else:
-                                fp2_ch_count += 1
-                        ch_count = fp2_ch_count
-
-                if params[j].get(MK_MAPPING_PARAMS):
-                    ch_count = params[j][MK_MAPPING_PARAMS].get("ch_count", None)
-                    ch_start = params[j][MK_MAPPING_PARAMS].get("ch_start", None)
-
-                if ch_count:
-                    for i in range(ch_count):
-                        attr = params[j].get(MK_INIT_PARAMS)[MK_HASS_NAME]
-                        t = cls_list.get(attr, None)
-                        if t is None:
-                            t = cls_list["default"]
-                        if ch_start:
-                            instance = t(
-                                self._hass,
-                                device,
-                                params[j][MK_RESOURCES],
-                                i + ch_start,
-                                **params[j].get(MK_INIT_PARAMS) or {},
-                            )
-                        else:
-                            instance = t(
-                                self._hass,
-                                device,
-                                params[j][MK_RESOURCES],
-                                i + 1,
-                                **params[j].get(MK_INIT_PARAMS) or {},
-                            )
-                        self._devices_entities[device.did].append(instance)
-                        entities.append(instance)
-                else:
-                    attr = params[j].get(MK_INIT_PARAMS)[MK_HASS_NAME]
-                    t = cls_list.get(attr, None)
-                    if t is None:
-                        t = cls_list["default"]
-                    instance = t(
-                        self._hass,
-                        device,
-                        params[j][MK_RESOURCES],
-                        **params[j].get(MK_INIT_PARAMS) or {},
+        for x in descriptors:
+            t = cls_list.get(x.init_params[MK_HASS_NAME], None)
+            if t is None:
+                t = cls_list["default"]
+            if x.channel is None:
+                instance = t(self._hass, x.device, x.resources, **x.init_params)
+            else:
+                instance = t(
+                    self._hass, x.device, x.resources, x.channel, **x.init_params
+                )
+            self._add_device_entity(x.device.did, instance)
+            entities.append(instance)
+
+        await self._async_apply_initial_values(entities)
+        async_add_entities(entities)
+
+    async def async_fetch_initial_values(self, descriptors: list):
+        """批量获取实体计划中所有资源的初始值，代替每个实体单独update_before_add"""
+        resource_ids = {}
+        # 每个资源有多少个实体需要初始值，分发完后即释放
+        pending = {}
+        for x in descriptors:
+            res_ids = resource_ids.setdefault(x.device.did, {})
+            for res_id in {v[0].format(x.channel) for v in x.resources.values()}:
+                res_ids.setdefault(res_id)
+                key = (x.device.did, res_id)
+                pending[key] = pending.get(key, 0) + 1
+                # 本次没有返回的资源不能使用之前获取的旧值
+                self._initial_values.pop(key, None)
+        results = await self._session.async_query_resources_value(
+            [{"subjectId": k, "resourceIds": list(v)} for k, v in resource_ids.items()]
+        )
+        for x in results:
+            key = (x["subjectId"], x["resourceId"])
+            if key in pending:
+                self._initial_values[key] = [x, pending[key]]
+
+    async def _async_apply_initial_values(
+        self, entities: list, write_ha_state: bool = False
+    ):
+        """将预先获取的初始值分发给实体，实体已添加到HA时需写入状态"""
+        for entity in entities:
+            for res_id in entity.resource_map:
+                key = (entity.device.did, res_id)
+                item = self._initial_values.get(key)
+                if item is None:
+                    continue
+                x = item[0]
+                item[1] -= 1
+                if item[1] <= 0:
+                    self._initial_values.pop(key)
+                try:
+                    await entity.async_set_attr(
+                        x["resourceId"],
+                        x["value"],
+                        x["timeStamp"],
+                        write_ha_state=write_ha_state,
+                    )
+                except Exception as _:
+                    _LOGGER.exception(
+                        f"[apply_initial_values, error]{x['subjectId']}, {x['resourceId']}"
                     )
-                    self._devices_entities[device.did].append(instance)
-                    entities.append(instance)
 
-        async_add_entities(entities, update_before_add=True)
+    @staticmethod
+    def _is_channel_resource(model: str, res_id: str) -> bool:
+        template = CHANNEL_PROBED_MODELS.get(model)
+        if template is None:
+            return False
+        prefix, suffix = template.split("{}")
+        if not (res_id.startswith(prefix) and res_id.endswith(suffix)):
+            return False
+        channel = res_id[len(prefix) : -len(suffix)]
+        return channel.isdigit() and 0 < int(channel) <= MAX_PROBED_CHANNELS
+
+    async def _async_get_channel_count(self, device: AiotDevice):
+        """获取多通道特殊设备的通道数量，优先使用缓存"""
+        if device.model not in CHANNEL_PROBED_MODELS:
+            return None
+        await self._channel_cache.async_load()
+        ch_count = self._channel_cache.get(device.did)
+        if ch_count is not None:
+            return ch_count
+
+        if device.model == "lumi.airrtc.vrfegl01":
+            # VRF空调控制器
+            resp = await self._session.async_query_resource_value(
+                device.did, ["13.1.85"]
+            )
+            _LOGGER.info(f"resp: {resp}")
+            if not resp:
+                return None
+            ch_count = int(resp[0]["value"])
+        elif device.model == "lumi.motion.agl001":
+            # 人体场景传感器 FP2，一次查询所有区域，连续存在的区域数量即通道数量
+            resp = await self._session.async_query_resource_value(
+                device.did, [f"3.{x + 1}.85" for x in range(MAX_PROBED_CHANNELS)]
+            )
+            if resp is None:
+                return None
+            existing = {x["resourceId"] for x in resp}
+            ch_count = 0
+            while (
+                ch_count < MAX_PROBED_CHANNELS and f"3.{ch_count + 1}.85" in existing
+            ):
+                ch_count += 1
+        self._channel_cache.set(device.did, ch_count)
+        return ch_count
+
+    def _add_device_entity(self, did: str, entity: AiotEntityBase):
+        """登记设备的实体，同时更新消息分发表"""
+        self._devices_entities.setdefault(did, []).append(entity)
+        for res_id, res_name in entity.resource_map.items():
+            self._resource_dispatch.setdefault((did, res_id), []).append(
+                (entity, res_name)
+            )
+            if (
+                entity.type_name == "event"
+                or entity.hass_attr_name in DELTA_HASS_NAMES
+            ):
+                self._event_resources.add((did, res_id))
+
+    def _remove_device_entities(self, did: str):
+        """移除设备的所有实体，同时清理消息分发表"""
+        for entity in self._devices_entities.pop(did, []):
+            for res_id in entity.resource_map:
+                self._resource_dispatch.pop((did, res_id), None)
+                self._event_resources.discard((did, res_id))
+
+    def _is_event_resource(self, key: tuple) -> bool:
+        """事件类资源的每次上报都是一次触发，变化量资源的每次上报都是一个增量，不能合并或丢弃"""
+        return key in self._event_resources
+
+    async def async_remove_snapshot(self, config_entry):
+        """删除配置对象的设备快照，同时取消尚未写入的保存"""
+        await self._get_snapshot(config_entry.entry_id).async_remove()
+        self._snapshots.pop(config_entry.entry_id, None)
 
     async def async_remove_entry(self, config_entry):
         """ConfigEntry remove."""
         self._config_entries.pop(config_entry.entry_id)
+        self._entries_plans.pop(config_entry.entry_id, None)
+        self._entries_adders.pop(config_entry.entry_id, None)
+        self._forward_tasks.pop(config_entry.entry_id, None)
         device_ids = self._entries_devices[config_entry.entry_id]
         for device_id in device_ids:
             self._managed_devices.pop(device_id)
-            self._devices_entities.pop(device_id)
+            self._remove_device_entities(device_id)
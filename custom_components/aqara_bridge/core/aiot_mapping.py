@@ -1,3 +1,6 @@
+from types import MappingProxyType
+from typing import Mapping, Optional
+
 from homeassistant.components.binary_sensor import BinarySensorDeviceClass
 from homeassistant.components.climate import (
     FAN_AUTO,
@@ -28,6 +31,7 @@ from homeassistant.const import (
     UnitOfTemperature,
 )
 
+from .aiot_model_index import AiotModelSpec, index_platform_params
 from .const import (
     GESTURE_MAPPING,
     PET_MAPPING,
@@ -38,14 +42,14 @@ from .const import (
     KN_BUTTON_3_MAPPING,
     KN_SLIDE_MAPPING,
     FP_MOTION_MAPPING,
+    MK_MAPPING_PARAMS,
+    MK_INIT_PARAMS,
+    MK_RESOURCES,
+    MK_HASS_NAME,
 )
 
-# AiotDevice Mapping
-MK_MAPPING_PARAMS = "mapping_params"
-MK_INIT_PARAMS = "init_params"
-MK_RESOURCES = "resources"
-MK_HASS_NAME = "hass_attr_name"
-
+# 修改后需运行 python custom_components/aqara_bridge/core/aiot_model_index.py
+# 重新生成aiot_model_index.pickle，否则启动时会改为导入这里的映射表
 AIOT_DEVICE_MAPPING = [
     ############################ Aqara M1S网关###################################
     {
@@ -2692,3 +2696,26 @@ AIOT_DEVICE_MAPPING = [
         "params": [],
     },
 ]
+
+
+def _build_model_index(mapping) -> Mapping[str, AiotModelSpec]:
+    """Index AIOT_DEVICE_MAPPING by model, the first matching entry wins."""
+    index = {}
+    for device in mapping:
+        params = tuple(device["params"])
+        spec_params = index_platform_params(params)
+        for model, info in device.items():
+            if model == "params":
+                continue
+            index.setdefault(
+                model, AiotModelSpec(tuple(info), params, spec_params)
+            )
+    return MappingProxyType(index)
+
+
+AIOT_MODEL_INDEX = _build_model_index(AIOT_DEVICE_MAPPING)
+
+
+def get_model_spec(model: str) -> Optional[AiotModelSpec]:
+    """获取设备型号的映射信息，不支持的型号返回None"""
+    return AIOT_MODEL_INDEX.get(model)
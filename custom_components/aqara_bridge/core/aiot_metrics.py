@@ -0,0 +1,174 @@
+"""Runtime metrics for the Aqara Bridge component."""
+
+import math
+import time
+from collections import deque
+
+# 每个指标保留的最近耗时样本数量
+LATENCY_SAMPLE_SIZE = 512
+# 计算消息速率的时间窗口（秒）
+MESSAGE_RATE_WINDOW = 60
+
+
+class AiotLatencyHistogram:
+    """最近若干次耗时（毫秒）的分位数统计"""
+
+    def __init__(self, max_size: int = LATENCY_SAMPLE_SIZE):
+        self._samples = deque(maxlen=max_size)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self._samples.append(value)
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float):
+        """p取值0-100，没有样本时返回None"""
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        index = max(0, math.ceil(p / 100 * len(samples)) - 1)
+        return round(samples[index], 1)
+
+    def as_dict(self) -> dict:
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": round(self.max, 1),
+        }
+
+
+class AiotIntentMetrics:
+    """单个intent的请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        # 错误码（或异常类型） -> 次数
+        self.errors = {}
+        self.latency = AiotLatencyHistogram()
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.error_count,
+            "errors_by_code": dict(self.errors),
+            "retries": self.retries,
+            "latency_ms": self.latency.as_dict(),
+        }
+
+
+class AiotCloudMetrics:
+    """intent -> 请求次数、错误、重试和耗时"""
+
+    def __init__(self):
+        self._intents = {}
+
+    def get(self, intent: str) -> AiotIntentMetrics:
+        metrics = self._intents.get(intent)
+        if metrics is None:
+            metrics = self._intents[intent] = AiotIntentMetrics()
+        return metrics
+
+    def record_request(self, intent: str, latency_ms: float, code=0):
+        """记录一次请求，code为返回码或异常类型名，没有返回码视为成功"""
+        metrics = self.get(intent)
+        metrics.requests += 1
+        metrics.latency.add(latency_ms)
+        if code not in (0, None):
+            key = str(code)
+            metrics.errors[key] = metrics.errors.get(key, 0) + 1
+
+    def record_retry(self, intent: str):
+        self.get(intent).retries += 1
+
+    def as_dict(self) -> dict:
+        return {intent: m.as_dict() for intent, m in sorted(self._intents.items())}
+
+
+class AiotMessageMetrics:
+    """MQ消息链路统计：云端到接收的延迟、接收到更新状态的耗时、速率和积压"""
+
+    def __init__(self, rate_window: int = MESSAGE_RATE_WINDOW):
+        self._rate_window = rate_window
+        # received只在MQ线程中修改，其余只在事件循环中修改
+        self.received = 0
+        self.handled = 0
+        self.items = 0
+        self.unknown_subjects = 0
+        self.unsupported_resources = 0
+        self.cloud_lag = AiotLatencyHistogram()
+        self.state_latency = AiotLatencyHistogram()
+        self._handled_times = deque()
+        # 消息队列的当前长度、最高水位、丢弃和阻塞次数，在MQ线程中修改
+        self.queue_depth = 0
+        self.queue_high_water = 0
+        self.dropped = 0
+        self.blocked = 0
+        # 合并窗口内被新值覆盖的上报数量
+        self.coalesced = 0
+
+    def record_received(self):
+        self.received += 1
+
+    def record_queue_depth(self, depth: int):
+        self.queue_depth = depth
+        if depth > self.queue_high_water:
+            self.queue_high_water = depth
+
+    def record_handled(self, msg_time, received_at: float):
+        """消息处理完成，msg_time为云端毫秒时间戳，received_at为接收时的time.time()"""
+        now = time.time()
+        self.handled += 1
+        self._handled_times.append(now)
+        if msg_time:
+            self.cloud_lag.add(max(0.0, received_at * 1000 - int(msg_time)))
+        self.state_latency.add((now - received_at) * 1000)
+
+    def record_item(self, unknown_subject: bool = False, unsupported: bool = False):
+        self.items += 1
+        if unknown_subject:
+            self.unknown_subjects += 1
+        if unsupported:
+            self.unsupported_resources += 1
+
+    @property
+    def pending(self) -> int:
+        """已接收但还未处理完的消息数"""
+        return max(0, self.received - self.handled - self.dropped)
+
+    @property
+    def messages_per_second(self) -> float:
+        threshold = time.time() - self._rate_window
+        while self._handled_times and self._handled_times[0] < threshold:
+            self._handled_times.popleft()
+        return round(len(self._handled_times) / self._rate_window, 2)
+
+    def _ratio(self, count: int) -> float:
+        return round(count / self.items, 4) if self.items else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "handled": self.handled,
+            "pending": self.pending,
+            "queue_high_water": self.queue_high_water,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "coalesced": self.coalesced,
+            "messages_per_second": self.messages_per_second,
+            "items": self.items,
+            "unknown_subjects": self.unknown_subjects,
+            "unknown_subject_rate": self._ratio(self.unknown_subjects),
+            "unsupported_resources": self.unsupported_resources,
+            "unsupported_resource_rate": self._ratio(self.unsupported_resources),
+            "cloud_lag_ms": self.cloud_lag.as_dict(),
+            "state_latency_ms": self.state_latency.as_dict(),
+        }
@@ -0,0 +1,302 @@
+"""Model index of AIOT_DEVICE_MAPPING, optionally loaded from a prebuilt artifact.
+
+Executing the 2,700-line mapping literal builds every entry and imports the HA
+components of every platform on each start. ``aiot_model_index.pickle`` holds
+the same table indexed by model, with each entry pickled separately and the
+imported names (HA enums, constants) kept as references. An entry is decoded
+only when one of its models is looked up, so only the specs and HA components
+of the devices in the account are loaded. The artifact records the hash of
+aiot_mapping.py; when it is missing or stale the mapping literal is used.
+
+Rebuild the artifact after editing aiot_mapping.py:
+
+    python custom_components/aqara_bridge/core/aiot_model_index.py
+"""
+
+import ast
+import hashlib
+import importlib
+import io
+import logging
+import os
+import pickle
+import sys
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# 产物格式版本，编码方式变化时递增
+ARTIFACT_VERSION = 1
+ARTIFACT_FILE = "aiot_model_index.pickle"
+MAPPING_FILE = "aiot_mapping.py"
+MAPPING_NAME = "AIOT_DEVICE_MAPPING"
+
+# 映射表中允许在构建时求值的函数
+_BUILD_CALLS = {"float": float, "int": int, "str": str}
+
+
+class AiotModelSpec(NamedTuple):
+    """Precomputed mapping entry of one device model."""
+
+    # [manufacturer, name, hardware version]
+    manufacturer_info: tuple
+    # 原始params列表，保持映射表中的顺序
+    params: tuple
+    # platform -> 该平台下的params，保持映射表中的顺序
+    platform_params: Mapping[str, tuple]
+
+
+def index_platform_params(params: tuple) -> Mapping[str, tuple]:
+    """按平台归类params，保持映射表中的顺序"""
+    platform_params = {}
+    for p in params:
+        for platform, param in p.items():
+            platform_params.setdefault(platform, []).append(param)
+    return MappingProxyType({k: tuple(v) for k, v in platform_params.items()})
+
+
+class _Ref(NamedTuple):
+    """映射表中导入的名称，如ColorMode.XY"""
+
+    module: str
+    path: str
+
+
+class _Or(NamedTuple):
+    """按位或，如ClimateEntityFeature.TARGET_TEMPERATURE | ..."""
+
+    left: object
+    right: object
+
+
+def _persistent_id(value):
+    if isinstance(value, _Ref):
+        return ("ref", value.module, value.path)
+    if isinstance(value, _Or):
+        return ("or", _persistent_id(value.left), _persistent_id(value.right))
+    return ("value", value)
+
+
+class _EntryPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if isinstance(obj, (_Ref, _Or)):
+            return _persistent_id(obj)
+        return None
+
+
+class _EntryUnpickler(pickle.Unpickler):
+    """只还原内置类型和引用，不加载任何其他对象"""
+
+    def __init__(self, file, refs: dict):
+        super().__init__(file)
+        # (module, path) -> 引用的对象
+        self._refs = refs
+
+    def persistent_load(self, pid):
+        kind = pid[0]
+        if kind == "or":
+            return self.persistent_load(pid[1]) | self.persistent_load(pid[2])
+        if kind == "value":
+            return pid[1]
+        value = self._refs.get(pid)
+        if value is None:
+            # 引用的模块在这里才导入
+            value = importlib.import_module(pid[1], __package__)
+            for name in pid[2].split("."):
+                value = getattr(value, name)
+            self._refs[pid] = value
+        return value
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"global '{module}.{name}' is not allowed")
+
+
+class AiotModelIndex(Mapping):
+    """从产物按需解码的型号索引，同一映射项的型号共享解码结果"""
+
+    def __init__(self, models: dict, entries: list):
+        # model -> (manufacturer_info, 映射项序号)
+        self._models = models
+        # 每个映射项pickle后的params
+        self._entries = entries
+        self._refs = {}
+        self._params = {}
+        self._specs = {}
+
+    def __getitem__(self, model: str) -> AiotModelSpec:
+        spec = self._specs.get(model)
+        if spec is not None:
+            return spec
+        info, entry_no = self._models[model]
+        params = self._params.get(entry_no)
+        if params is None:
+            data = io.BytesIO(self._entries[entry_no])
+            params = tuple(_EntryUnpickler(data, self._refs).load())
+            # 解码后不再需要原始数据
+            self._entries[entry_no] = None
+            params = self._params[entry_no] = (params, index_platform_params(params))
+        spec = self._specs[model] = AiotModelSpec(info, *params)
+        return spec
+
+    def __iter__(self):
+        return iter(self._models)
+
+    def __len__(self):
+        return len(self._models)
+
+
+def _encode(node, imports: dict):
+    """按AST节点求出映射表的值，导入的名称保留为引用"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Dict) and None not in node.keys:
+        return {
+            _encode(k, imports): _encode(v, imports)
+            for k, v in zip(node.keys, node.values)
+        }
+    if isinstance(node, ast.List):
+        return [_encode(x, imports) for x in node.elts]
+    if isinstance(node, ast.Tuple):
+        return tuple(_encode(x, imports) for x in node.elts)
+    if isinstance(node, ast.Set):
+        return {_encode(x, imports) for x in node.elts}
+    if isinstance(node, ast.Name) and node.id in imports:
+        return _Ref(imports[node.id], node.id)
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+        ref = _encode(node.value, imports)
+        return _Ref(ref.module, f"{ref.path}.{node.attr}")
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        return _Or(_encode(node.left, imports), _encode(node.right, imports))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _encode(node.operand, imports)
+        if isinstance(value, (int, float)):
+            return -value
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in _BUILD_CALLS
+        and not node.keywords
+    ):
+        args = [_encode(x, imports) for x in node.args]
+        if all(isinstance(x, (str, int, float)) for x in args):
+            return _BUILD_CALLS[node.func.id](*args)
+    raise ValueError(
+        f"{MAPPING_FILE}:{node.lineno}: unsupported expression {ast.unparse(node)}"
+    )
+
+
+def _dumps(value) -> bytes:
+    data = io.BytesIO()
+    _EntryPickler(data, pickle.HIGHEST_PROTOCOL).dump(value)
+    return data.getvalue()
+
+
+def source_hash(source: bytes) -> str:
+    return hashlib.sha256(source).hexdigest()
+
+
+def build_artifact(source: bytes) -> bytes:
+    """解析aiot_mapping.py的源码生成产物，不需要导入HA"""
+    tree = ast.parse(source)
+    imports = {}
+    mapping = None
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            for alias in node.names:
+                imports[alias.asname or alias.name] = module
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(x, ast.Name) and x.id == MAPPING_NAME for x in node.targets
+        ):
+            mapping = node.value
+    if not isinstance(mapping, ast.List):
+        raise ValueError(f"{MAPPING_FILE}: {MAPPING_NAME} list not found")
+
+    models = {}
+    entries = []
+    for node in mapping.elts:
+        device = _encode(node, imports)
+        entry_no = len(entries)
+        entries.append(_dumps(device["params"]))
+        for model, info in device.items():
+            # 与_build_model_index一致，第一个匹配的映射项生效
+            if model != "params":
+                models.setdefault(model, (tuple(info), entry_no))
+    return _dumps(
+        {
+            "version": ARTIFACT_VERSION,
+            "source": source_hash(source),
+            "models": models,
+            "entries": entries,
+        }
+    )
+
+
+def load_artifact(directory: str = None) -> Optional[AiotModelIndex]:
+    """加载产物，不存在、无法解析或与aiot_mapping.py不一致时返回None"""
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    try:
+        with open(os.path.join(directory, MAPPING_FILE), "rb") as f:
+            source = f.read()
+        with open(os.path.join(directory, ARTIFACT_FILE), "rb") as f:
+            artifact = _EntryUnpickler(f, {}).load()
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError) as e:
+        _LOGGER.warning(
+            "Model index artifact not loaded, using %s: %s", MAPPING_FILE, e
+        )
+        return None
+    if (
+        not isinstance(artifact, dict)
+        or artifact.get("version") != ARTIFACT_VERSION
+        or artifact.get("source") != source_hash(source)
+    ):
+        _LOGGER.warning("Model index artifact is stale, using %s", MAPPING_FILE)
+        return None
+    return AiotModelIndex(artifact["models"], artifact["entries"])
+
+
+_model_index = None
+
+
+def load_model_index() -> Mapping[str, AiotModelSpec]:
+    """获取型号索引，优先使用产物，失效时导入映射表。首次调用会阻塞，需在线程中调用"""
+    global _model_index
+    if _model_index is None:
+        index = load_artifact()
+        if index is None:
+            from .aiot_mapping import AIOT_MODEL_INDEX as index
+        _model_index = index
+    return _model_index
+
+
+def write_artifact(directory: str = None) -> bytes:
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(directory, MAPPING_FILE), "rb") as f:
+        artifact = build_artifact(f.read())
+    with open(os.path.join(directory, ARTIFACT_FILE), "wb") as f:
+        f.write(artifact)
+    return artifact
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=f"Build {ARTIFACT_FILE}")
+    parser.add_argument(
+        "--check", action="store_true", help="exit 1 if the artifact is stale"
+    )
+    args = parser.parse_args()
+    if args.check:
+        if load_artifact() is None:
+            print(f"{ARTIFACT_FILE} is stale, rebuild it")
+            sys.exit(1)
+        print(f"{ARTIFACT_FILE} is up to date")
+        return
+    write_artifact()
+    index = load_artifact()
+    print(f"{ARTIFACT_FILE}: {len(index)} models, {len(index._entries)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ CONF_FIELD_APP_ID = "field_app_id"
 CONF_FIELD_APP_KEY = "field_app_key"
 CONF_FIELD_KEY_ID = "field_key_id"
 CONF_OCCUPANCY_TIMEOUT = "occupancy_timeout"
+CONF_MSG_COALESCE_WINDOW = "msg_coalesce_window"
+CONF_WRITE_BATCH_SIZE = "write_batch_size"
 
 # Cloud
 SERVER_COUNTRY_CODES = ["CN", "USA", "KR", "RU", "GER"]
@@ -33,6 +35,12 @@ CONF_ENTRY_AUTH_ACCESS_TOKEN = "access_token"
 CONF_ENTRY_AUTH_REFRESH_TOKEN = "refresh_token"
 CONF_ENTRY_AUTH_OPENID = "open_id"
 
+# AiotDevice Mapping
+MK_MAPPING_PARAMS = "mapping_params"
+MK_INIT_PARAMS = "init_params"
+MK_RESOURCES = "resources"
+MK_HASS_NAME = "hass_attr_name"
+
 # HASS DATA
 HASS_DATA_AUTH_ENTRY_ID = "auth_entry_id"
 HASS_DATA_AIOTCLOUD = "aiotcloud"
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from homeassistant.components.cover import CoverEntity
 
@@ -89,14 +90,16 @@ class AiotAirerEntity(AiotEntityBase, CoverEntity):
         # self._attr_is_closed = kwargs.get("is_closed")
 
     async def async_open_cover(self, **kwargs):
+        writes = [self.async_set_resource("is_closed", False)]
         if self.device.model == "lumi.airer.acn02":
-            await self.async_set_resource("current_cover_position", 100)
-        await self.async_set_resource("is_closed", False)
+            writes.insert(0, self.async_set_resource("current_cover_position", 100))
+        await asyncio.gather(*writes)
 
     async def async_close_cover(self, **kwargs):
+        writes = [self.async_set_resource("is_closed", True)]
         if self.device.model == "lumi.airer.acn02":
-            await self.async_set_resource("current_cover_position", 0)
-        await self.async_set_resource("is_closed", True)
+            writes.insert(0, self.async_set_resource("current_cover_position", 0))
+        await asyncio.gather(*writes)
 
     async def async_set_cover_position(self, **kwargs):
         pos = kwargs.get("position")
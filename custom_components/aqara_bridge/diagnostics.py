@@ -0,0 +1,43 @@
+"""Diagnostics support for Aqara Bridge."""
+
+from homeassistant.components.diagnostics import async_redact_data
+
+from .core.aiot_cloud import AiotCloud
+from .core.aiot_manager import AiotManager
+from .core.const import (
+    CONF_ENTRY_APP_KEY,
+    CONF_ENTRY_AUTH_ACCESS_TOKEN,
+    CONF_ENTRY_AUTH_ACCOUNT,
+    CONF_ENTRY_AUTH_OPENID,
+    CONF_ENTRY_AUTH_REFRESH_TOKEN,
+    DOMAIN,
+    HASS_DATA_AIOTCLOUD,
+    HASS_DATA_AIOT_MANAGER,
+)
+
+TO_REDACT = {
+    CONF_ENTRY_APP_KEY,
+    CONF_ENTRY_AUTH_ACCESS_TOKEN,
+    CONF_ENTRY_AUTH_ACCOUNT,
+    CONF_ENTRY_AUTH_OPENID,
+    CONF_ENTRY_AUTH_REFRESH_TOKEN,
+}
+
+
+async def async_get_config_entry_diagnostics(hass, config_entry) -> dict:
+    """下载诊断信息：配置（脱敏）、设备数量、云端请求和MQ消息统计"""
+    aiotcloud: AiotCloud = hass.data[DOMAIN][HASS_DATA_AIOTCLOUD]
+    manager: AiotManager = hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER]
+    return {
+        "entry": async_redact_data(dict(config_entry.data), TO_REDACT),
+        "devices": {
+            "all": len(manager.all_devices),
+            "managed": len(manager.managed_devices),
+            "unsupported": len(manager.unsupported_devices),
+        },
+        "cloud": {
+            "queue_depth": aiotcloud.queue_depth,
+            "intents": aiotcloud.metrics.as_dict(),
+        },
+        "messages": manager.msg_metrics.as_dict(),
+    }
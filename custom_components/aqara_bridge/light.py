@@ -1,8 +1,10 @@
+import asyncio
 import logging
 
 from homeassistant.components.light import ColorMode, LightEntity
 import homeassistant.util.color as color_util
 
+from .core.aiot_codec import AiotCodec, reciprocal, scale
 from .core.aiot_manager import AiotManager, AiotToggleableEntityBase
 from .core.const import DOMAIN, HASS_DATA_AIOT_MANAGER
 from .core.utils import (
@@ -28,6 +30,14 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 
 
 class AiotLightEntity(AiotToggleableEntityBase, LightEntity):
+    _res_codecs = {
+        # res_value：0-100，亮度百分比；attr_value：0-255
+        "brightness": scale(255, 100, type_=int, result=int, encode=int),
+        # res_value：153-500
+        "color_temp": AiotCodec(int, int),
+        "color_temp_kelvin": reciprocal(1000000),
+    }
+
     def __init__(self, hass, device, res_params, channel=None, **kwargs):
         AiotToggleableEntityBase.__init__(
             self, hass, device, res_params, TYPE, channel, **kwargs
@@ -49,13 +59,15 @@ class AiotLightEntity(AiotToggleableEntityBase, LightEntity):
 
     async def async_turn_on(self, **kwargs):
         """Turn the specified light on."""
+        # 并发写入，同一设备的多个资源会合并为一次请求
+        writes = []
         xy_color = kwargs.get("xy_color")
         if xy_color:
-            await self.async_set_resource("color", xy_color)
+            writes.append(self.async_set_resource("color", xy_color))
 
         rgb_color = kwargs.get("rgb_color")
         if rgb_color:
-            await self.async_set_resource("color", rgb_color)
+            writes.append(self.async_set_resource("color", rgb_color))
 
         # hs_color = kwargs.get("hs_color")
         # if hs_color:
@@ -67,23 +79,23 @@ class AiotLightEntity(AiotToggleableEntityBase, LightEntity):
 
         brightness = kwargs.get("brightness")
         if brightness:
-            await self.async_set_resource("brightness", brightness)
+            writes.append(self.async_set_resource("brightness", brightness))
 
         color_temp = kwargs.get("color_temp")
         if color_temp:
-            await self.async_set_resource("color_temp", color_temp)
+            writes.append(self.async_set_resource("color_temp", color_temp))
 
         color_temp_kelvin = kwargs.get("color_temp_kelvin")
-        if color_temp:
-            await self.async_set_resource("color_temp_kelvin", color_temp_kelvin)
+        if color_temp_kelvin:
+            writes.append(
+                self.async_set_resource("color_temp_kelvin", color_temp_kelvin)
+            )
 
-        await super().async_turn_on(**kwargs)
+        writes.append(super().async_turn_on(**kwargs))
+        await asyncio.gather(*writes)
 
     def convert_attr_to_res(self, res_name, attr_value):
-        if res_name == "brightness":
-            # attr_value：0-255，亮度
-            return int(attr_value * 100 / 255)
-        elif res_name == "color" and self._attr_color_mode == ColorMode.HS:
+        if res_name == "color" and self._attr_color_mode == ColorMode.HS:
             # attr_value：hs颜色
             rgb_color = color_util.color_hs_to_RGB(*attr_value)
             return int(
@@ -99,18 +111,10 @@ class AiotLightEntity(AiotToggleableEntityBase, LightEntity):
             return light_convert_xy_to_uint32(attr_value[0], attr_value[1])
         elif res_name == "color" and self._attr_color_mode == ColorMode.RGB:
             return light_convert_rgb_to_argb(attr_value, 25)
-        elif res_name == "color_temp":
-            # attr_value：color temp
-            return int(attr_value)
-        elif res_name == "color_temp_kelvin":
-            return int(1000000 / int(attr_value))
         return super().convert_attr_to_res(res_name, attr_value)
 
     def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "brightness":
-            # res_value：0-100，亮度百分比
-            return int(int(res_value) * 255 / 100)
-        elif res_name == "color" and self._attr_color_mode == ColorMode.HS:
+        if res_name == "color" and self._attr_color_mode == ColorMode.HS:
             # res_value：十进制整数字符串
             argb = hex(int(res_value))
             return color_util.color_RGB_to_hs(
@@ -120,9 +124,4 @@ class AiotLightEntity(AiotToggleableEntityBase, LightEntity):
             return light_convert_unit32_to_xy(int(res_value))
         elif res_name == "color" and self._attr_color_mode == ColorMode.RGB:
             return light_convert_argb_to_rgb(int(res_value))
-        elif res_name == "color_temp":
-            # res_value：153-500
-            return int(res_value)
-        elif res_name == "color_temp_kelvin":
-            return int(1000000 / int(res_value))
         return super().convert_res_to_attr(res_name, res_value)
@@ -1,15 +1,21 @@
 import time
 from datetime import datetime
 from homeassistant.components.sensor import SensorEntity
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity import DeviceInfo
 from .core.utils import local_zone
 import logging
 
+from .core.aiot_cloud import AiotCloud
+from .core.aiot_codec import ENERGY, INT, cast, scale
 from .core.aiot_manager import (
     AiotManager,
     AiotEntityBase,
 )
 from .core.const import (
     DOMAIN,
+    HASS_DATA_AIOTCLOUD,
     HASS_DATA_AIOT_MANAGER,
 )
 
@@ -19,6 +25,15 @@ TYPE = "sensor"
 
 DATA_KEY = f"{TYPE}.{DOMAIN}"
 
+# 生成诊断传感器的云端接口
+DIAGNOSTIC_INTENTS = [
+    "query.resource.value",
+    "write.resource.device",
+    "query.device.info",
+    "query.position.detail",
+    "query.resource.name",
+]
+
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     manager: AiotManager = hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER]
@@ -26,9 +41,114 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     await manager.async_add_entities(
         config_entry, TYPE, cls_entities, async_add_entities
     )
+    async_add_entities(gen_diagnostic_sensors(hass, config_entry), True)
+
+
+def gen_diagnostic_sensors(hass, config_entry) -> list:
+    """生成诊断传感器：每个云端intent的p95耗时，以及MQ消息链路统计"""
+    aiotcloud: AiotCloud = hass.data[DOMAIN][HASS_DATA_AIOTCLOUD]
+    entities = []
+    for intent in DIAGNOSTIC_INTENTS:
+        metrics = aiotcloud.metrics.get(intent)
+        entities.append(
+            AiotDiagnosticSensor(
+                config_entry,
+                f"cloud_{intent.replace('.', '_')}_latency",
+                f"Cloud {intent} latency",
+                lambda m=metrics: m.latency.percentile(95),
+                lambda m=metrics: m.as_dict(),
+                UnitOfTime.MILLISECONDS,
+            )
+        )
+
+    manager: AiotManager = hass.data[DOMAIN][HASS_DATA_AIOT_MANAGER]
+    metrics = manager.msg_metrics
+    entities.extend(
+        [
+            AiotDiagnosticSensor(
+                config_entry,
+                "message_cloud_lag",
+                "Message cloud lag",
+                lambda: metrics.cloud_lag.percentile(95),
+                lambda: metrics.cloud_lag.as_dict(),
+                UnitOfTime.MILLISECONDS,
+            ),
+            AiotDiagnosticSensor(
+                config_entry,
+                "message_state_latency",
+                "Message state latency",
+                lambda: metrics.state_latency.percentile(95),
+                lambda: metrics.state_latency.as_dict(),
+                UnitOfTime.MILLISECONDS,
+            ),
+            AiotDiagnosticSensor(
+                config_entry,
+                "message_rate",
+                "Message rate",
+                lambda: metrics.messages_per_second,
+                lambda: metrics.as_dict(),
+                "msg/s",
+            ),
+            AiotDiagnosticSensor(
+                config_entry,
+                "message_pending",
+                "Message pending",
+                lambda: metrics.pending,
+            ),
+            AiotDiagnosticSensor(
+                config_entry,
+                "message_queue_high_water",
+                "Message queue high water",
+                lambda: metrics.queue_high_water,
+                lambda: {
+                    "queue_depth": metrics.queue_depth,
+                    "dropped": metrics.dropped,
+                    "blocked": metrics.blocked,
+                    "coalesced": metrics.coalesced,
+                },
+            ),
+        ]
+    )
+    return entities
+
+
+class AiotDiagnosticSensor(SensorEntity):
+    """集成自身运行状态的诊断传感器，挂在ConfigEntry对应的服务设备下"""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, config_entry, key, name, value_fn, attrs_fn=None, unit=None):
+        self._value_fn = value_fn
+        self._attrs_fn = attrs_fn
+        self._attr_name = name
+        self._attr_unique_id = f"{DOMAIN}.{config_entry.entry_id}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, config_entry.entry_id)},
+            name="Aqara Bridge",
+            manufacturer="Aqara",
+            entry_type=DeviceEntryType.SERVICE,
+        )
+
+    async def async_update(self):
+        self._attr_native_value = self._value_fn()
+        if self._attrs_fn is not None:
+            self._attr_extra_state_attributes = self._attrs_fn()
 
 
 class AiotSensorEntity(AiotEntityBase, SensorEntity):
+    _res_codecs = {
+        "battery": INT,
+        "rotation_angle": INT,
+        "press_rotation_angle": INT,
+        "density": INT,
+        "energy": ENERGY,
+        "current": scale(220, ndigits=3),
+        "temperature": scale(1, 100, 1, int),
+        "humidity": scale(1, 100, 1, int),
+        "TVOC": cast(float, int),
+    }
+
     def __init__(self, hass, device, res_params, channel=None, **kwargs):
         AiotEntityBase.__init__(self, hass, device, res_params, TYPE, channel, **kwargs)
         self._attr_state_class = kwargs.get("state_class")
@@ -46,24 +166,3 @@ class AiotSensorEntity(AiotEntityBase, SensorEntity):
     @property
     def last_update_at(self):
         return self.trigger_dt
-
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "battery":
-            return int(res_value)
-        if res_name == "rotation_angle":
-            return int(res_value)
-        if res_name == "press_rotation_angle":
-            return int(res_value)
-        if res_name == "density":
-            return int(res_value)
-        if res_name == "energy":
-            return round(float(res_value) / 1000.0, 3)
-        if res_name == "current":
-            return round(float(res_value) * 220.0, 3)
-        if res_name == "temperature":
-            return round(int(res_value) / 100.0, 1)
-        if res_name == "humidity":
-            return round(int(res_value) / 100.0, 1)
-        if res_name == "TVOC":
-            return int(float(res_value))
-        return super().convert_res_to_attr(res_name, res_value)
@@ -1,5 +1,6 @@
 from homeassistant.components.switch import SwitchEntity
 
+from .core.aiot_codec import ENERGY, FLAG, LQI
 from .core.aiot_manager import AiotManager, AiotToggleableEntityBase
 from .core.const import DOMAIN, HASS_DATA_AIOT_MANAGER, PROP_TO_ATTR_BASE
 
@@ -17,6 +18,13 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 
 
 class AiotSwitchEntity(AiotToggleableEntityBase, SwitchEntity):
+    _res_codecs = {
+        "decoupled": FLAG,
+        "in_use": FLAG,
+        "energy": ENERGY,
+        "zigbee_lqi": LQI,
+    }
+
     def __init__(self, hass, device, res_params, channel=None, **kwargs):
         AiotToggleableEntityBase.__init__(
             self, hass, device, res_params, TYPE, channel, **kwargs
@@ -28,21 +36,14 @@ class AiotSwitchEntity(AiotToggleableEntityBase, SwitchEntity):
         """return icon."""
         return "mdi:power-socket"
 
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "toggle" or res_name == "decoupled":
-            return res_value == "1"
-        if res_name == "energy":
-            return round(float(res_value) / 1000.0, 3)
-        if res_name == "firmware_version":
-            return res_value
-        if res_name == "zigbee_lqi":
-            return int(res_value)
-        if res_name == "in_use":
-            return res_value == "1"
-        return super().convert_res_to_attr(res_name, res_value)
-
 
 class AiotWallSwitchEntity(AiotToggleableEntityBase, SwitchEntity):
+    _res_codecs = {
+        "decoupled": FLAG,
+        "energy": ENERGY,
+        "zigbee_lqi": LQI,
+    }
+
     def __init__(self, hass, device, res_params, channel=None, **kwargs):
         AiotToggleableEntityBase.__init__(
             self, hass, device, res_params, TYPE, channel, **kwargs
@@ -53,14 +54,3 @@ class AiotWallSwitchEntity(AiotToggleableEntityBase, SwitchEntity):
     def icon(self):
         """return icon."""
         return "mdi:light-switch"
-
-    def convert_res_to_attr(self, res_name, res_value):
-        if res_name == "toggle" or res_name == "decoupled":
-            return res_value == "1"
-        if res_name == "energy":
-            return round(float(res_value) / 1000.0, 3)
-        if res_name == "firmware_version":
-            return res_value
-        if res_name == "zigbee_lqi":
-            return int(res_value)
-        return super().convert_res_to_attr(res_name, res_value)
@@ -0,0 +1,117 @@
+"""Tests for the resource value codecs."""
+
+from custom_components.aqara_bridge.core.aiot_codec import (
+    ENERGY,
+    FLAG,
+    INT,
+    TOGGLE,
+    VOLTAGE,
+    AiotCodec,
+    boolean,
+    cast,
+    get_class_codecs,
+    nonzero,
+    passthrough,
+    reciprocal,
+    scale,
+)
+
+
+def test_scale_decode():
+    assert scale(1, 100, 1, int).decode("2356") == 23.6
+    assert scale(220, ndigits=3).decode("0.5") == 110.0
+    assert scale(ndigits=1).decode("21.44") == 21.4
+    assert VOLTAGE.decode("3012") == "3.012"
+    assert ENERGY.decode("12345") == 12.345
+
+
+def test_scale_round_trip():
+    # 灯的亮度：0-100 <-> 0-255
+    brightness = scale(255, 100, type_=int, result=int, encode=int)
+    assert brightness.decode("100") == 255
+    assert brightness.decode("50") == 127
+    assert brightness.encode(255) == 100
+    assert brightness.encode(brightness.decode("40")) == 40
+    assert scale(1, 100).encode is None
+
+
+def test_reciprocal_round_trip():
+    codec = reciprocal(1000000)
+    assert codec.decode("250") == 4000
+    assert codec.encode(4000) == 250
+    assert codec.encode(codec.decode("370")) == 370
+
+
+def test_boolean_round_trip():
+    assert TOGGLE.decode("1") is True
+    assert TOGGLE.decode("0") is False
+    assert TOGGLE.encode(True) == "1"
+    assert TOGGLE.encode(False) == "0"
+    codec = boolean("on", "off")
+    assert codec.encode(codec.decode("on")) == "on"
+    assert codec.encode(codec.decode("off")) == "off"
+    # 只读的开关量
+    assert FLAG.decode("1") is True
+    assert FLAG.encode is None
+
+
+def test_nonzero():
+    codec = nonzero()
+    assert codec.decode("0") is False
+    assert codec.decode("2") is True
+    assert codec.encode is None
+
+
+def test_cast_and_passthrough():
+    assert INT.decode("42") == 42
+    assert cast(float, int).decode("12.7") == 12
+    value = object()
+    assert passthrough(value) is value
+
+
+A_CODEC = AiotCodec(str)
+B_CODEC = AiotCodec(int)
+C_CODEC = AiotCodec(float)
+D_CODEC = AiotCodec(bool)
+
+
+class _Base:
+    def convert_res_to_attr(self, res_name, res_value):
+        return res_value
+
+
+class _Parent(_Base):
+    _res_codecs = {"a": A_CODEC, "b": A_CODEC}
+
+
+class _Child(_Parent):
+    _res_codecs = {"b": B_CODEC}
+
+
+class _Override(_Child):
+    _res_codecs = {"c": C_CODEC}
+
+    def convert_res_to_attr(self, res_name, res_value):
+        return super().convert_res_to_attr(res_name, res_value)
+
+
+class _GrandChild(_Override):
+    _res_codecs = {"d": D_CODEC}
+
+
+def test_class_codecs_merge_along_mro():
+    codecs, direct = get_class_codecs(_Child)
+    # 子类声明的覆盖父类
+    assert codecs == {"a": A_CODEC, "b": B_CODEC}
+    assert direct == codecs
+
+
+def test_class_codecs_behind_overridden_convert():
+    codecs, direct = get_class_codecs(_GrandChild)
+    assert codecs == {"a": A_CODEC, "b": B_CODEC, "c": C_CODEC, "d": D_CODEC}
+    # 父类声明的只能经过重写的convert_res_to_attr使用
+    assert direct == {"c": C_CODEC, "d": D_CODEC}
+
+
+def test_class_codecs_cached():
+    assert get_class_codecs(_Child) is get_class_codecs(_Child)